@@ -0,0 +1,319 @@
+"""
+Benchmarks every GET route of the API (plus a few write scenarios) against a seeded SQLite database.
+
+    $ pipenv run python benchmarks/api.py --rows 10000
+    $ pipenv run python benchmarks/api.py --rows 100000 --server gunicorn --workers 4
+    $ pipenv run python benchmarks/api.py --rows 10000 --save benchmarks/baseline.json
+    $ pipenv run python benchmarks/api.py --rows 10000 --baseline benchmarks/baseline.json
+
+--server client drives the app in-process through the WSGI test client, --server gunicorn starts
+a real `gunicorn wsgi` and talks HTTP to it. --db memory seeds an in-memory SQLite database
+(test client only, every gunicorn worker would get its own empty database).
+Requests are sent as seeded user 1, logged in through POST /login, with valid path and query
+parameters. Reports req/s, p50/p99 latency and peak RSS per endpoint; an endpoint that answers
+anything but a 2xx is reported as failing and the run exits with 1 without saving or comparing,
+so error paths are never measured as results. --baseline prints the difference with a previous
+--save and exits with 1 when an endpoint got slower than --tolerance percent.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import tempfile
+import subprocess
+import http.client
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+SEED_BATCH = 10000
+BENCH_USER_ID = 1
+BENCH_PASSWORD = 'benchmark'
+# path parameters with a fixed value, the others get a random id
+FIXED_ARGUMENTS = {'table': 'planet', 'user_id': str(BENCH_USER_ID)}
+# the favorites of user 1 in the seeded data, for the /favorite/... routes
+FAVORITE_IDS = {'character_id': '1', 'planet_id': '2', 'vehicle_id': '3'}
+QUERY_STRINGS = {'/search': 'q=planet+1'}
+CLIMATES = ['temperate', 'tropical', 'arid', 'frozen', 'murky']
+TERRAINS = ['desert', 'ocean', 'tundra', 'other']
+MANUFACTURERS = ['Corellia Mining Corporation', 'SoroSuub Corporation', 'Incom Corporation', 'Sienar Fleet Systems']
+
+def rss_kb(pid='self'):
+    try:
+        with open('/proc/%s/status' % pid) as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def children(pid):
+    try:
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def seed(db, models, rows):
+    from werkzeug.security import generate_password_hash
+    User, Character, Planet, Vehicle, Favorites = models
+    db.drop_all()
+    db.create_all()
+    password = generate_password_hash(BENCH_PASSWORD)
+
+    def insert(model, build):
+        for start in range(1, rows + 1, SEED_BATCH):
+            stop = min(start + SEED_BATCH, rows + 1)
+            db.session.execute(model.__table__.insert(), [build(i) for i in range(start, stop)])
+            db.session.commit()
+
+    # the benchmark user is an admin, for /export
+    insert(User, lambda i: {
+        'id': i, 'email': 'user%d@example.com' % i, 'username': 'user%d' % i, 'password': password,
+        'is_active': True, 'is_admin': i == BENCH_USER_ID,
+    })
+    insert(Planet, lambda i: {
+        'id': i, 'name': 'Planet %d' % i, 'climate': random.choice(CLIMATES), 'terrain': random.choice(TERRAINS),
+        'diameter': random.randint(1000, 200000), 'population': random.randint(0, 10 ** 9), 'gravity': '1 standard',
+    })
+    insert(Character, lambda i: {
+        'id': i, 'name': 'Character %d' % i, 'gender': random.choice(['male', 'female', 'other']),
+        'eye_color': 'blue', 'hair_color': 'brown', 'height': random.randint(60, 250), 'planet_id': random.randint(1, rows),
+    })
+    insert(Vehicle, lambda i: {
+        'id': i, 'name': 'Vehicle %d' % i, 'model': 'Model %d' % (i % 50), 'speed': random.randint(100, 1500),
+        'manufacturer': random.choice(MANUFACTURERS), 'character_id': random.randint(1, rows),
+    })
+    # one favorite of each type per user, spread over the catalog
+    insert(Favorites, lambda i: {
+        'id': i, 'user_id': (i - 1) // 3 + 1,
+        'character_id': i if i % 3 == 1 else None, 'planet_id': i if i % 3 == 2 else None, 'vehicle_id': i if i % 3 == 0 else None,
+    })
+
+def scenarios(app, rows):
+    """
+    One scenario per GET route found in the url map (path parameters filled with random ids),
+    plus list variants and the write endpoints that can be replayed safely.
+    """
+    found = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        path = rule.rule
+        for argument in rule.arguments:
+            if rule.rule.startswith('/favorite/'):
+                value = FAVORITE_IDS[argument]
+            else:
+                value = FIXED_ARGUMENTS.get(argument, '{id}')
+            path = path.replace('<int:%s>' % argument, value).replace('<%s>' % argument, value)
+        if rule.rule in QUERY_STRINGS:
+            path += '?' + QUERY_STRINGS[rule.rule]
+        found.append(('GET ' + rule.rule, 'GET', path, None))
+
+    found += [
+        ('GET /characters?limit=100', 'GET', '/characters?limit=100', None),
+        ('GET /planets?limit=100&sort=-population', 'GET', '/planets?limit=100&sort=-population', None),
+        ('GET /vehicles?limit=100&fields=id,name', 'GET', '/vehicles?limit=100&fields=id,name', None),
+        ('GET /characters?stream=1&limit=1000', 'GET', '/characters?stream=1&limit=1000', None),
+        ('POST /planets/bulk (100 rows)', 'POST', '/planets/bulk', lambda: json.dumps([
+            {'id': i, 'name': 'Planet %d' % i, 'climate': random.choice(CLIMATES)}
+            for i in random.sample(range(1, rows + 1), 100)
+        ])),
+    ]
+    return found
+
+class ClientDriver:
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.headers = {}
+
+    def request(self, method, path, body):
+        # (status, body)
+        response = self.client.open(path, method=method, data=body, content_type='application/json', headers=self.headers)
+        return response.status_code, response.get_data()
+
+    def rss(self):
+        return rss_kb()
+
+    def close(self):
+        pass
+
+class GunicornDriver:
+    def __init__(self, env, workers):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.process = subprocess.Popen(
+            ['gunicorn', 'wsgi', '--chdir', SRC, '-w', str(workers), '-b', '127.0.0.1:%d' % self.port],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.connection = None
+        self.headers = {}
+        for _ in range(100):
+            try:
+                self.connect()
+                if self.request('GET', '/health', None)[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("gunicorn did not start")
+
+    def connect(self):
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+
+    def send(self, method, path, body):
+        headers = dict(self.headers, **{'Content-Type': 'application/json'})
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def request(self, method, path, body):
+        # (status, body)
+        try:
+            return self.send(method, path, body)
+        except (http.client.HTTPException, OSError):
+            # gunicorn sync workers close the connection after every response
+            self.connect()
+            return self.send(method, path, body)
+
+    def rss(self):
+        pids = [self.process.pid] + children(self.process.pid)
+        return sum(rss_kb(pid) for pid in pids)
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+def login(driver):
+    # every following request carries the token of the benchmark user
+    body = json.dumps({'email': 'user%d@example.com' % BENCH_USER_ID, 'password': BENCH_PASSWORD})
+    status, data = driver.request('POST', '/login', body)
+    if status != 200:
+        raise RuntimeError("login failed with %d: %s" % (status, data[:200]))
+    driver.headers['Authorization'] = 'Bearer %s' % json.loads(data)['token']
+
+def is_success(status):
+    return 200 <= status < 300
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run(driver, found, rows, requests, warmup):
+    results = {}
+    for name, method, path, body in found:
+        timings = []
+        statuses = set()
+        peak = driver.rss()
+        for i in range(warmup + requests):
+            url = path.replace('{id}', str(random.randint(1, rows)))
+            payload = body() if body else None
+            start = time.perf_counter()
+            statuses.add(driver.request(method, url, payload)[0])
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                timings.append(elapsed)
+            peak = max(peak, driver.rss())
+        timings.sort()
+        results[name] = {
+            'rps': round(len(timings) / sum(timings), 1),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'peak_rss_kb': peak,
+            'statuses': sorted(statuses),
+            'ok': all(is_success(status) for status in statuses),
+        }
+    return results
+
+def report(results, baseline, tolerance):
+    regressions = []
+    print("%-48s %10s %10s %10s %12s %s" % ('endpoint', 'req/s', 'p50 ms', 'p99 ms', 'peak RSS kB', 'status'))
+    for name, result in results.items():
+        line = "%-48s %10.1f %10.3f %10.3f %12d %s" % (
+            name, result['rps'], result['p50_ms'], result['p99_ms'], result['peak_rss_kb'], result['statuses'])
+        if not result['ok']:
+            print(line + "  FAILED")
+            continue
+        previous = (baseline or {}).get(name)
+        if previous and previous.get('ok', True):
+            change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0
+            line += "  p50 %+.1f%%" % change
+            if change > tolerance:
+                regressions.append(name)
+        print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help="rows per table (10k to 1M)")
+    parser.add_argument('--db', choices=['file', 'memory'], default='file')
+    parser.add_argument('--server', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--no-cache', action='store_true', help="disable the response cache")
+    parser.add_argument('--save', help="write the results as a JSON baseline")
+    parser.add_argument('--baseline', help="compare against a JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=20.0, help="allowed p50 regression in percent")
+    args = parser.parse_args()
+
+    if args.db == 'memory' and args.server == 'gunicorn':
+        parser.error("--db memory only works with --server client")
+
+    random.seed(42)
+    if args.db == 'memory':
+        database_url = 'sqlite://'
+    else:
+        database_url = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench-%d.db' % args.rows)
+    os.environ['DATABASE_URL'] = database_url
+    # the /login tokens need a signing key, shared with the gunicorn workers
+    os.environ.setdefault('FLASK_APP_KEY', os.urandom(16).hex())
+    if args.no_cache:
+        os.environ['RESPONSE_CACHE_SIZE'] = '0'
+
+    from app import create_app
+    app = create_app()
+    # failing endpoints show up in the status column, not as tracebacks
+    app.logger.setLevel(logging.CRITICAL)
+    from models import db, User, Character, Planet, Vehicle, Favorites
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(db, (User, Character, Planet, Vehicle, Favorites), args.rows)
+        print("Seeded %d rows per table in %.1fs (%s)" % (args.rows, time.perf_counter() - start, database_url))
+
+        found = scenarios(app, args.rows)
+        if args.server == 'gunicorn':
+            driver = GunicornDriver(dict(os.environ), args.workers)
+        else:
+            driver = ClientDriver(app)
+        try:
+            login(driver)
+            results = run(driver, found, args.rows, args.requests, args.warmup)
+        finally:
+            driver.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(results, baseline, args.tolerance)
+
+    failed = [name for name, result in results.items() if not result['ok']]
+    if failed:
+        print("Endpoints answering errors, not saved nor compared: %s" % ', '.join(failed))
+        sys.exit(1)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if regressions:
+        print("Regressions over %.0f%%: %s" % (args.tolerance, ', '.join(regressions)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
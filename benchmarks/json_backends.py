@@ -0,0 +1,64 @@
+"""
+Compares the JSON backends of FastJSONProvider on catalog-shaped payloads.
+
+    $ pipenv run python benchmarks/json_backends.py
+"""
+import os
+import sys
+import timeit
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from flask import Flask
+from json_provider import FastJSONProvider, available_backends
+
+CLIMATES = ['temperate', 'tropical', 'arid', 'frozen', 'murky']
+TERRAINS = ['jungle, rainforests', 'grasslands, mountains', 'ocean', 'desert', 'tundra']
+
+def planets(count):
+    return [{
+        'id': i,
+        'name': 'Planet %d' % i,
+        'diameter': random.randint(1000, 200000),
+        'climate': random.choice(CLIMATES),
+        'terrain': random.choice(TERRAINS),
+        'surface_water': random.randint(0, 100),
+        'population': random.randint(0, 10 ** 9),
+        'orbital_period': random.randint(100, 1000),
+        'rotation_period': random.randint(10, 50),
+        'gravity': '1 standard',
+    } for i in range(count)]
+
+def characters(count):
+    return [{
+        'id': i,
+        'name': 'Character %d' % i,
+        'birth_year': '%dBBY' % random.randint(1, 900),
+        'gender': random.choice(['male', 'female', 'other']),
+        'height': random.randint(60, 250),
+        'weight': random.randint(20, 150),
+        'eyes': random.choice(['blue', 'brown', 'green', 'black', 'other']),
+        'hair': random.choice(['blond', 'brown', 'ginger', 'black', 'other']),
+    } for i in range(count)]
+
+def main():
+    app = Flask(__name__)
+    provider = FastJSONProvider(app)
+    print("%-10s %-8s %-8s %-6s %12s" % ('payload', 'rows', 'backend', 'sorted', 'ms/encode'))
+    for name, build in (('planets', planets), ('characters', characters)):
+        for count in (100, 1000, 10000):
+            payload = build(count)
+            for backend in available_backends():
+                for sort_keys in (True, False):
+                    provider.backend = backend
+                    provider.sort_keys = sort_keys
+                    if backend == 'msgspec':
+                        import msgspec
+                        provider._encoder = msgspec.json.Encoder(enc_hook=provider.default, order='sorted' if sort_keys else None)
+                    number = max(1, 20000 // count)
+                    seconds = timeit.timeit(lambda: provider.dumps_bytes(payload), number=number)
+                    print("%-10s %-8d %-8s %-6s %12.3f" % (name, count, backend, sort_keys, seconds / number * 1000))
+
+if __name__ == '__main__':
+    main()
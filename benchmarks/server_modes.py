@@ -0,0 +1,128 @@
+"""
+Compares the WSGI (sync gunicorn workers) and ASGI (uvicorn workers, AsyncSession) serving modes
+under concurrent load, on the same seeded SQLite file.
+
+    $ pipenv run python benchmarks/server_modes.py --rows 10000 --concurrency 200 --workers 2
+
+Each mode is started with `gunicorn -c src/gunicorn.conf.py` and SERVER_MODE set accordingly;
+the response cache is disabled so every request reaches the database.
+"""
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api import SRC, seed, percentile
+
+PATHS = (
+    '/characters/{id}',
+    '/planets/{id}',
+    '/vehicles/{id}',
+    '/users/{id}/favorites',
+    '/characters?limit=50&after={id}',
+    '/planets?limit=50&sort=-population',
+)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(mode, env, workers):
+    port = free_port()
+    env = dict(env, SERVER_MODE=mode, WEB_CONCURRENCY=str(workers), RESPONSE_CACHE_SIZE='0')
+    process = subprocess.Popen(
+        ['gunicorn', '-c', os.path.join(SRC, 'gunicorn.conf.py'), '-b', '127.0.0.1:%d' % port],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("%s server did not start" % mode)
+
+def load(port, rows, concurrency, requests):
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = []
+        for _ in range(per_thread):
+            path = random.choice(PATHS).replace('{id}', str(random.randint(1, rows)))
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[0] += 1
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            except (http.client.HTTPException, OSError):
+                errors[0] += 1
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            local.append(time.perf_counter() - start)
+        with lock:
+            timings.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        'rps': len(timings) / elapsed,
+        'p50_ms': percentile(timings, 0.5) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'errors': errors[0],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    # never the configured DATABASE_URL, seeding drops every table
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'bench-modes-%d.db' % args.rows)
+
+    from app import create_app
+    app = create_app()
+    from models import db, User, Character, Planet, Vehicle, Favorites
+    with app.app_context():
+        seed(db, (User, Character, Planet, Vehicle, Favorites), args.rows)
+
+    print("%-6s %10s %10s %10s %8s" % ('mode', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for mode in ('wsgi', 'asgi'):
+        process, port = start_server(mode, dict(os.environ), args.workers)
+        try:
+            result = load(port, args.rows, args.concurrency, args.requests)
+        finally:
+            process.terminate()
+            process.wait()
+        print("%-6s %10.1f %10.3f %10.3f %8d" % (mode, result['rps'], result['p50_ms'], result['p99_ms'], result['errors']))
+
+if __name__ == '__main__':
+    main()
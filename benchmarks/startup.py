@@ -0,0 +1,82 @@
+"""
+Measures how long a worker takes to import the app, with `python -X importtime`, for the
+full app and for an API-only worker (ENABLE_ADMIN=0).
+
+    $ pipenv run python benchmarks/startup.py
+    $ pipenv run python benchmarks/startup.py --runs 10 --top 20
+    $ pipenv run python benchmarks/startup.py --budget-ms 500
+
+Every run is a fresh interpreter doing `import wsgi` (what a gunicorn worker does on boot).
+Reports the median total import time and the slowest top-level imports; with --budget-ms the
+script exits with 1 when the API-only import is over budget. tests/test_startup.py enforces the
+budget (STARTUP_BUDGET_MS) and checks that the optional modules stay out of API-only workers.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+CONFIGS = (
+    ('full', {'ENABLE_ADMIN': '1', 'ENABLE_SWAGGER': '1'}),
+    ('default', {}),
+    ('api-only', {'ENABLE_ADMIN': '0', 'ENABLE_SWAGGER': '0'}),
+)
+
+def import_times(env):
+    """
+    Returns {module: (self us, cumulative us, depth)} of one `import wsgi` in a new interpreter.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import wsgi'],
+        cwd=SRC, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(own), int(cumulative), depth)
+    return modules
+
+def measure(overrides, runs):
+    env = dict(os.environ, **overrides)
+    # building the app does not connect, but keep any configured database out of it
+    env['DATABASE_URL'] = 'sqlite://'
+    totals = []
+    top_level = {}
+    for _ in range(runs):
+        modules = import_times(env)
+        totals.append(sum(own for own, _, _ in modules.values()) / 1000)
+        for name, (_, cumulative, depth) in modules.items():
+            # direct imports of wsgi/app, where the time of a dependency shows up
+            if depth in (1, 2):
+                top_level.setdefault(name, []).append(cumulative / 1000)
+    return statistics.median(totals), {name: statistics.median(times) for name, times in top_level.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="slowest imports listed per configuration")
+    parser.add_argument('--budget-ms', type=float, help="maximum import time of the api-only configuration")
+    args = parser.parse_args()
+
+    results = {}
+    for name, overrides in CONFIGS:
+        total, top_level = measure(overrides, args.runs)
+        results[name] = total
+        print("%-10s %8.1f ms" % (name, total))
+        for module, elapsed in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+            print("    %-40s %8.1f ms" % (module, elapsed))
+
+    if args.budget_ms is not None and results['api-only'] > args.budget_ms:
+        print("api-only import takes %.1f ms, over the %.0f ms budget" % (results['api-only'], args.budget_ms))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
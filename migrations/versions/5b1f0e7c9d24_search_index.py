@@ -0,0 +1,64 @@
+"""search index
+
+Revision ID: 5b1f0e7c9d24
+Revises: ea54a1074ce5
+Create Date: 2026-10-18 12:02:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0e7c9d24'
+down_revision = 'ea54a1074ce5'
+branch_labels = None
+depends_on = None
+
+# same DDL as search.sqlite_statements(backfill=True) and search.postgresql_statements()
+SQLITE_TABLES = (
+    ('character', 1, "''"),
+    ('planet', 2, "''"),
+    ('vehicle', 3, "coalesce({row}.model, '') || ' ' || coalesce({row}.manufacturer, '')"),
+)
+POSTGRESQL_INDEXES = (
+    ('search_character_name_trgm', 'character', 'name'),
+    ('search_planet_name_trgm', 'planet', 'name'),
+    ('search_vehicle_name_trgm', 'vehicle', 'name'),
+    ('search_vehicle_model_trgm', 'vehicle', 'model'),
+)
+
+
+def sqlite_upgrade():
+    op.execute("CREATE VIRTUAL TABLE search_index USING fts5(name, extra, prefix='2 3')")
+    for table, tag, extra in SQLITE_TABLES:
+        def values(row):
+            return "%s.id * 4 + %d, %s.name, %s" % (row, tag, row, extra.format(row=row))
+        insert = "INSERT INTO search_index (rowid, name, extra) VALUES (%s);" % values('new')
+        delete = "DELETE FROM search_index WHERE rowid = old.id * 4 + %d;" % tag
+        op.execute("CREATE TRIGGER search_%s_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert))
+        op.execute("CREATE TRIGGER search_%s_update AFTER UPDATE ON %s BEGIN %s %s END" % (table, table, delete, insert))
+        op.execute("CREATE TRIGGER search_%s_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete))
+        op.execute("INSERT INTO search_index (rowid, name, extra) SELECT %s FROM %s" % (values(table), table))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        sqlite_upgrade()
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for name, table, column in POSTGRESQL_INDEXES:
+            op.execute('CREATE INDEX IF NOT EXISTS %s ON "%s" USING gin (%s gin_trgm_ops)' % (name, table, column))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for table, _, _ in SQLITE_TABLES:
+            for event in ('insert', 'update', 'delete'):
+                op.execute("DROP TRIGGER IF EXISTS search_%s_%s" % (table, event))
+        op.execute("DROP TABLE IF EXISTS search_index")
+    elif dialect == 'postgresql':
+        for name, _, _ in POSTGRESQL_INDEXES:
+            op.execute("DROP INDEX IF EXISTS %s" % name)
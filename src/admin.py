@@ -1,20 +1,163 @@
-import os
+from flask import Response, request
 from flask_admin import Admin
+from sqlalchemy import func, inspect, text
+from sqlalchemy.orm import joinedload
 from models import db, User, Character, Planet, Vehicle, Favorites
 from flask_admin.contrib.sqla import ModelView
+from serializers import sorted_keyset_page
+from utils import APIException, keyset_page
+from auth import authenticate, hash_password, password_matches, user_status
+
+# a filtered or searched list counts its rows up to this number
+ADMIN_COUNT_LIMIT = 10000
+
+def estimated_count(model):
+    """
+    Number of rows of a table from the planner statistics instead of a COUNT(*) that scans it:
+    pg_class.reltuples on Postgres, information_schema.tables on MySQL and the largest id on
+    SQLite. Tables without statistics yet (never analyzed) are counted up to ADMIN_COUNT_LIMIT.
+    """
+    table = model.__tablename__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        estimate = db.session.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                                      {'table': '"%s"' % table}).scalar()
+    elif dialect == 'mysql':
+        estimate = db.session.execute(text("SELECT table_rows FROM information_schema.tables "
+                                           "WHERE table_schema = DATABASE() AND table_name = :table"),
+                                      {'table': table}).scalar()
+    else:
+        estimate = db.session.execute(db.select(func.max(model.id))).scalar() or 0
+    if estimate is None or estimate < 0:
+        return capped_count(db.session.query(model))
+    return estimate
+
+def capped_count(query):
+    rows = query.with_entities(db.literal(1)).order_by(None).limit(ADMIN_COUNT_LIMIT).subquery()
+    return db.session.execute(db.select(func.count()).select_from(rows)).scalar()
+
+def admin_user_id():
+    """
+    Id of the admin user of the request, None when there is none. The admin takes the Bearer token
+    of the API, or from a browser HTTP Basic credentials (email and password) of an admin user.
+    """
+    credentials = request.authorization
+    try:
+        if credentials is not None and credentials.type == 'basic':
+            user = User.query.filter_by(email=credentials.username).first()
+            if user is None or not user.is_active or not password_matches(user.password, credentials.password or ''):
+                return None
+            user_id = user.id
+        else:
+            user_id = authenticate()
+    except APIException:
+        return None
+    return user_id if user_status(user_id)[2] else None
+
+class CatalogView(ModelView):
+    """
+    ModelView that stays fast on large tables:
+    - the row count comes from estimated_count(), or from capped_count() when filtered
+    - pages are keyset pages on (sort column, id), ?after=<id of the last row> instead of OFFSET
+    - only the indexed columns of Model.sort_fields are sortable
+    - the many-to-one relationships shown in the list are joined in the page query, and edited
+      through ajax lookups instead of a select of the whole related table
+    - only admin users get in, see admin_user_id()
+    """
+    list_template = 'admin/keyset_list.html'
+    page_size = 50
+    can_set_page_size = True
+
+    def __init__(self, model, session, **kwargs):
+        relationships = [relationship for relationship in inspect(model).relationships
+                         if relationship.direction.name == 'MANYTOONE']
+        self.column_sortable_list = model.sort_fields
+        self.column_select_related_list = [getattr(model, relationship.key) for relationship in relationships]
+        self.form_ajax_refs = {
+            relationship.key: {'fields': ('username',) if relationship.mapper.class_ is User else ('name',), 'page_size': 10}
+            for relationship in relationships
+        }
+        super().__init__(model, session, **kwargs)
+
+    def is_accessible(self):
+        return admin_user_id() is not None
+
+    def inaccessible_callback(self, name, **kwargs):
+        return Response("Admin access required", 401, {'WWW-Authenticate': 'Basic realm="admin"'})
+
+    def _get_list_url(self, view_args):
+        # sorting, searching and filtering start over from the first page
+        extra_args = {key: value for key, value in view_args.extra_args.items() if key != 'after'}
+        return super()._get_list_url(view_args.clone(extra_args=extra_args))
+
+    def first_page_url(self):
+        return self._get_list_url(self._get_list_extra_args())
+
+    def next_page_url(self, data, page_size):
+        # None on the last page
+        if not page_size or len(data) < page_size:
+            return None
+        view_args = self._get_list_extra_args()
+        url = self._get_list_url(view_args)
+        return '%s%safter=%d' % (url, '&' if '?' in url else '?', data[-1].id)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        model = self.model
+        joins = {}
+        query = self.get_query()
+        filtered = False
+        if self._search_supported and search:
+            query, _, joins, _ = self._apply_search(query, None, joins, {}, search)
+            filtered = True
+        if filters and self._filters:
+            query, _, joins, _ = self._apply_filters(query, None, joins, {}, filters)
+            filtered = True
+        count = capped_count(query) if filtered else estimated_count(model)
+
+        if page_size is None:
+            page_size = self.page_size
+        limit = page_size or None
+        after = request.args.get('after', type=int)
+        column = getattr(model, sort_column) if sort_column else model.id
+        if column is model.id and not sort_desc:
+            query = keyset_page(query, model, limit, after)
+        else:
+            value = None
+            if after is not None:
+                value = self.session.query(column).filter(model.id == after).scalar()
+            query = sorted_keyset_page(query, model, column, sort_desc, limit, after, value)
+        query = query.options(*[joinedload(relationship) for relationship in self._auto_joins])
+
+        if execute:
+            query = query.all()
+        return count, query
+
+class UserView(CatalogView):
+    # admins are made in the database and tokens revoked by /logout, not through a form. The password
+    # is only set when the user is created, and saved hashed.
+    column_exclude_list = ('password',)
+    form_excluded_columns = ('is_admin', 'token_version')
+
+    def edit_form(self, obj=None):
+        form = super().edit_form(obj)
+        del form.password
+        return form
+
+    def on_model_change(self, form, model, is_created):
+        if is_created:
+            model.password = hash_password(model.password)
 
 def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
-    admin.add_view(ModelView(Favorites, db.session))
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(CatalogView(Character, db.session))
+    admin.add_view(CatalogView(Planet, db.session))
+    admin.add_view(CatalogView(Vehicle, db.session))
+    admin.add_view(CatalogView(Favorites, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(CatalogView(YourModelName, db.session))
@@ -2,65 +2,156 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from functools import partial
+from flask import Flask, Blueprint, current_app, g, request, jsonify, url_for
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, Character, Planet, Vehicle, Favorites
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException, build_sitemap, get_sitemap
+from cache import cached, response_cache, entry_response
+from bulk import bulk_upsert, iter_request_rows
+from favorites_queue import favorites_queue
+from serializers import list_response, included_resources
+from search import search
+from patch import patch_item, commit_versioned, version_matches, with_version, item_response
+from transfer import get_model, export_response, import_request_rows, import_rows
+from auth import admin_required, auth_required, owner_required, login, logout
+from schemas import request_body
+from json_provider import FastJSONProvider
+from pool import engine_options, pool_stats, dispose_engines_after_fork
+from replicas import replica_router
+from profiling import setup_profiling
+from compression import setup_compression
+from models import db, User, Character, Planet, Vehicle, Favorites, FavoritesDocument
 #from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+api = Blueprint('api', __name__)
+
+def create_app(migrations=True):
+    """
+    Application factory, used by the flask CLI (FLASK_APP=src/app.py) and by wsgi.py / asgi.py.
+    The admin (ENABLE_ADMIN, on by default) and the swagger spec (ENABLE_SWAGGER, off by default)
+    are only imported when enabled, API-only workers can boot without them with ENABLE_ADMIN=0.
+    Flask-Migrate is only needed by `flask db`, the web workers pass migrations=False.
+    """
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    # signs the auth tokens and the admin session, without it no token is issued or accepted
+    app.secret_key = os.environ.get('FLASK_APP_KEY') or None
+    if app.secret_key is None:
+        app.logger.warning("FLASK_APP_KEY is not set, the authenticated endpoints will answer 503")
+    app.json = FastJSONProvider(app)
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    if replica_router.enabled:
+        app.config['SQLALCHEMY_BINDS'] = replica_router.binds(engine_options)
+
+    db.init_app(app)
+    if replica_router.enabled:
+        replica_router.init_app(app, db)
+    if migrations:
+        from flask_migrate import Migrate
+        from transfer import register_commands
+        Migrate(app, db)
+        register_commands()
+    dispose_engines_after_fork(app, db)
+    CORS(app)
+    if os.getenv('ENABLE_ADMIN', '1') == '1':
+        from admin import setup_admin
+        setup_admin(app)
+    if os.getenv('ENABLE_SWAGGER', '0') == '1':
+        from swagger import setup_swagger
+        setup_swagger(app)
+    setup_profiling(app)
+    setup_compression(app)
+    if favorites_queue.enabled:
+        favorites_queue.init_app(app)
+    app.register_blueprint(api)
+    build_sitemap(app)
+    return app
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
-# generate sitemap with all your endpoints
-@app.route('/')
+# generate sitemap with all your endpoints, JSON for clients that ask for it
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    mimetype = request.accept_mimetypes.best_match(['text/html', 'application/json'], default='text/html')
+    response = entry_response(get_sitemap(current_app, mimetype))
+    response.vary.add('Accept')
+    return response
+
+# EndPoints HEALTH
+
+@api.route('/health', methods=['GET'])
+def health():
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError as e:
+        return jsonify({"status": "error", "error": str(e)}), 503
+    return jsonify({"status": "ok"}), 200
+
+@api.route('/health/pool', methods=['GET'])
+def health_pool():
+    return jsonify(pool_stats(db.engine)), 200
+
+@api.route('/health/replicas', methods=['GET'])
+def health_replicas():
+    return jsonify(replica_router.metrics()), 200
+
+@api.route('/health/favorites-queue', methods=['GET'])
+def health_favorites_queue():
+    return jsonify(favorites_queue.metrics()), 200
+
+# EndPoint SEARCH
+
+@api.route('/search', methods=['GET'])
+def search_catalog():
+    return jsonify(search(request.args)), 200
+
+# EndPoints EXPORT / IMPORT
+
+@api.route('/export/<table>', methods=['GET'])
+@admin_required
+def export_table(table):
+    return export_response(get_model(table))
+
+@api.route('/import/<table>', methods=['POST'])
+@admin_required
+def import_table(table):
+    return jsonify(import_rows(get_model(table), import_request_rows())), 200
 
 # EndPoint USER
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    serialized_users = [user.serialize() for user in users]
-    return jsonify(serialized_users), 200
+    return list_response(User)
 
 # EndPoints CHARACTER
 
-@app.route('/characters', methods=['GET'])
+@api.route('/characters', methods=['GET'])
+@cached('character', related=partial(included_resources, Character))
 def get_characters():
-    characters = Character.query.all()
-    serialized_characters = [character.serialize() for character in characters]
-    return jsonify(serialized_characters), 200
+    return list_response(Character)
 
-@app.route('/characters/<int:character_id>', methods=['GET'])
+@api.route('/characters/<int:character_id>', methods=['GET'])
+@cached('character', related=partial(included_resources, Character))
 def get_character(character_id):
     character = Character.query.get(character_id)
     if character is None:
         return jsonify({"error": "Character not found"}), 404
-    return jsonify(character.serialize()), 200
+    return item_response(character), 200
 
-@app.route('/characters', methods=['POST'])
+@api.route('/characters', methods=['POST'])
 def add_character():
-    body = request.get_json()
+    body = request_body(Character)
     character = Character(
         id = body['id'],
         name = body['name'],
@@ -74,35 +165,66 @@ def add_character():
     )
     db.session.add(character)
     db.session.commit()
+    response_cache.bump('character')
     return jsonify({"message": "Character created successfully", "character": character.serialize()}), 200
 
-@app.route('/characters/<int:character_id>', methods=['PUT'])
+@api.route('/characters/bulk', methods=['POST'])
+@admin_required
+def bulk_characters():
+    result = bulk_upsert(Character, iter_request_rows())
+    FavoritesDocument.invalidate('character_id')
+    db.session.commit()
+    response_cache.bump('character')
+    return jsonify(result), 200
+
+@api.route('/characters/<int:character_id>', methods=['PUT'])
 def update_character(character_id):
-    body = request.get_json()
+    body = request_body(Character)
     character = Character.query.get(character_id)
 
     if character:
-        character.name = body['name'],
-        character.birth_year = body['birth_year'],
-        character.gender = body['gender'],
-        character.height = body['height'],
-        character.weight = body['weight'],
-        character.eye_color = body['eye_color'],
-        character.hair_color = body['hair_color'],
-        character.planet_id = body['planet_id'],
-
-        db.session.commit()
-        return jsonify({"message": "Character updated successfully", "character": character.serialize()}), 200
+        if not version_matches(character.version):
+            return jsonify({"error": "Character was modified, reload it and try again"}), 412
+        character.name = body['name']
+        character.birth_year = body['birth_year']
+        character.gender = body['gender']
+        character.height = body['height']
+        character.weight = body['weight']
+        character.eye_color = body['eye_color']
+        character.hair_color = body['hair_color']
+        character.planet_id = body['planet_id']
+
+        if not commit_versioned():
+            return jsonify({"error": "Character was modified, reload it and try again"}), 412
+        response_cache.bump('character')
+        return with_version(jsonify({"message": "Character updated successfully", "character": character.serialize()}), character.version), 200
     else:
         return jsonify({"error": "Character not found"}), 404
 
-@app.route('/characters/<int:character_id>', methods=['DELETE'])
+@api.route('/characters/<int:character_id>', methods=['PATCH'])
+def patch_character(character_id):
+    body = request_body(Character, partial=True)
+    character, error = patch_item(Character, character_id, body)
+    if error:
+        return error
+
+    if 'name' in body:
+        FavoritesDocument.invalidate('character_id', character_id)
+    db.session.commit()
+    response_cache.bump('character')
+    return with_version(jsonify({"message": "Character updated successfully", "character": character}), character['version']), 200
+
+@api.route('/characters/<int:character_id>', methods=['DELETE'])
 def delete_character(character_id):
     character = Character.query.get(character_id)
 
     if character:
+        if not version_matches(character.version):
+            return jsonify({"error": "Character was modified, reload it and try again"}), 412
         db.session.delete(character)
-        db.session.commit()
+        if not commit_versioned():
+            return jsonify({"error": "Character was modified, reload it and try again"}), 412
+        response_cache.bump('character')
         return jsonify({"message": "Character deleted successfully"}), 200
     else:
         return jsonify({"error": "Character not found"}), 404
@@ -110,22 +232,29 @@ def delete_character(character_id):
 
 # EndPoints PLANET
 
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['GET'])
+@cached('planet', related=partial(included_resources, Planet))
 def get_planets():
-    planets = Planet.query.all()
-    serialized_planets = [planet.serialize() for planet in planets]
-    return jsonify(serialized_planets), 200
+    return list_response(Planet)
 
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@cached('planet', related=partial(included_resources, Planet))
 def get_planet(planet_id):
     planet = Planet.query.get(planet_id)
     if planet is None:
         return jsonify({"error": "Planet not found"}), 404
-    return jsonify(planet.serialize()), 200
+    return item_response(planet), 200
 
-@app.route('/planets', methods=['POST'])
+@api.route('/planets/<int:planet_id>/residents', methods=['GET'])
+@cached('character', related=lambda args: ('planet',) + included_resources(Character, args))
+def get_planet_residents(planet_id):
+    if Planet.query.get(planet_id) is None:
+        return jsonify({"error": "Planet not found"}), 404
+    return list_response(Character, Character.planet_id == planet_id)
+
+@api.route('/planets', methods=['POST'])
 def add_planet():
-    body = request.get_json()
+    body = request_body(Planet)
     planet = Planet(
         id = body['id'],
         name = body['name'],
@@ -141,37 +270,67 @@ def add_planet():
 
     db.session.add(planet)
     db.session.commit()
+    response_cache.bump('planet')
     return jsonify({"message": "Planet created successfully", "planet": planet.serialize()}), 200
 
-@app.route('/planets/<int:planet_id>', methods=['PUT'])
+@api.route('/planets/bulk', methods=['POST'])
+@admin_required
+def bulk_planets():
+    result = bulk_upsert(Planet, iter_request_rows())
+    FavoritesDocument.invalidate('planet_id')
+    db.session.commit()
+    response_cache.bump('planet')
+    return jsonify(result), 200
+
+@api.route('/planets/<int:planet_id>', methods=['PUT'])
 def update_planet(planet_id):
-    body = request.get_json()
+    body = request_body(Planet)
     planet = Planet.query.get(planet_id)
 
     if planet:
-        planet.id = body['id'],
-        planet.name = body['name'],
-        planet.diameter = body['diameter'],
-        planet.climate = body['climate'],
-        planet.terrain = body['terrain'],
-        planet.surface_water = body['surface_water'],
-        planet.population = body['population'],
-        planet.orbital_period = body['orbital_period'],
-        planet.rotation_period = body['rotation_period'],
-        planet.gravity = body['gravity'],
-
-        db.session.commit()
-        return jsonify({"message": "Planet updated successfully", "planet": planet.serialize()}), 200
+        if not version_matches(planet.version):
+            return jsonify({"error": "Planet was modified, reload it and try again"}), 412
+        planet.name = body['name']
+        planet.diameter = body['diameter']
+        planet.climate = body['climate']
+        planet.terrain = body['terrain']
+        planet.surface_water = body['surface_water']
+        planet.population = body['population']
+        planet.orbital_period = body['orbital_period']
+        planet.rotation_period = body['rotation_period']
+        planet.gravity = body['gravity']
+
+        if not commit_versioned():
+            return jsonify({"error": "Planet was modified, reload it and try again"}), 412
+        response_cache.bump('planet')
+        return with_version(jsonify({"message": "Planet updated successfully", "planet": planet.serialize()}), planet.version), 200
     else:
         return jsonify({"error": "Planet not found"}), 404
 
-@app.route('/planets/<int:planet_id>', methods=['DELETE'])
+@api.route('/planets/<int:planet_id>', methods=['PATCH'])
+def patch_planet(planet_id):
+    body = request_body(Planet, partial=True)
+    planet, error = patch_item(Planet, planet_id, body)
+    if error:
+        return error
+
+    if 'name' in body:
+        FavoritesDocument.invalidate('planet_id', planet_id)
+    db.session.commit()
+    response_cache.bump('planet')
+    return with_version(jsonify({"message": "Planet updated successfully", "planet": planet}), planet['version']), 200
+
+@api.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
     planet = Planet.query.get(planet_id)
 
     if planet:
+        if not version_matches(planet.version):
+            return jsonify({"error": "Planet was modified, reload it and try again"}), 412
         db.session.delete(planet)
-        db.session.commit()
+        if not commit_versioned():
+            return jsonify({"error": "Planet was modified, reload it and try again"}), 412
+        response_cache.bump('planet')
         return jsonify({"message": "Planet deleted successfully"}), 200
     else:
         return jsonify({"error": "Planet not found"}), 404
@@ -179,122 +338,195 @@ def delete_planet(planet_id):
 
 # EndPoints VEHICLE
 
-@app.route('/vehicles', methods=['GET'])
+@api.route('/vehicles', methods=['GET'])
+@cached('vehicle', related=partial(included_resources, Vehicle))
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    serialized_vehicles = [vehicle.serialize() for vehicle in vehicles]
-    return jsonify(serialized_vehicles), 200
+    return list_response(Vehicle)
 
-@app.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@cached('vehicle', related=partial(included_resources, Vehicle))
 def get_vehicle(vehicle_id):
     vehicle = Vehicle.query.get(vehicle_id)
     if vehicle is None:
         return jsonify({"error": "Vehicle not found"}), 404
-    return jsonify(vehicle.serialize()), 200
+    return item_response(vehicle), 200
 
-@app.route('/vehicles', methods=['POST'])
+@api.route('/vehicles', methods=['POST'])
 def add_vehicle():
-    body = request.get_json()
+    body = request_body(Vehicle)
 
     vehicle = Vehicle(
     id=body['id'],
     name=body['name'],
     model=body['model'],
     length=body['length'], 
-    cargo_capacity=body['cargo_capacity'],
+    cargo=body['cargo'],
     speed=body['speed'], 
     crew=body['crew'],  
     manufacturer=body['manufacturer'],
     passengers=body['passengers'],
+    character_id=body['character_id'],
 )
 
     db.session.add(vehicle)
     db.session.commit()
+    response_cache.bump('vehicle')
     return jsonify({"message": "Vehicle created successfully", "vehicle": vehicle.serialize()}), 200
 
-@app.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
+@api.route('/vehicles/bulk', methods=['POST'])
+@admin_required
+def bulk_vehicles():
+    result = bulk_upsert(Vehicle, iter_request_rows())
+    FavoritesDocument.invalidate('vehicle_id')
+    db.session.commit()
+    response_cache.bump('vehicle')
+    return jsonify(result), 200
+
+@api.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
 def update_vehicle(vehicle_id):
-    body = request.get_json()
+    body = request_body(Vehicle)
     vehicle = Vehicle.query.get(vehicle_id)
 
     if vehicle:
-        vehicle.id = body['id'],
-        vehicle.name = body['name'],
-        vehicle.model = body['model'],
-        vehicle.length = body['length'],
-        vehicle.cargo_capacity = body['cargo_capacity'],
-        vehicle.speed = body['speed'],
-        vehicle.crew = body['crew'],
-        vehicle.manufacturer = body['manufacturer'],
-        vehicle.passengers = body['passengers'],
-        
-        db.session.commit()
-        return jsonify({"message": "Vehicle updated successfully", "vehicle": vehicle.serialize()}), 200
+        if not version_matches(vehicle.version):
+            return jsonify({"error": "Vehicle was modified, reload it and try again"}), 412
+        vehicle.name = body['name']
+        vehicle.model = body['model']
+        vehicle.length = body['length']
+        vehicle.cargo = body['cargo']
+        vehicle.speed = body['speed']
+        vehicle.crew = body['crew']
+        vehicle.manufacturer = body['manufacturer']
+        vehicle.passengers = body['passengers']
+        vehicle.character_id = body['character_id']
+
+        if not commit_versioned():
+            return jsonify({"error": "Vehicle was modified, reload it and try again"}), 412
+        response_cache.bump('vehicle')
+        return with_version(jsonify({"message": "Vehicle updated successfully", "vehicle": vehicle.serialize()}), vehicle.version), 200
     else:
         return jsonify({"error": "Vehicle not found"}), 404
 
-@app.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['PATCH'])
+def patch_vehicle(vehicle_id):
+    body = request_body(Vehicle, partial=True)
+    vehicle, error = patch_item(Vehicle, vehicle_id, body)
+    if error:
+        return error
+
+    if 'name' in body:
+        FavoritesDocument.invalidate('vehicle_id', vehicle_id)
+    db.session.commit()
+    response_cache.bump('vehicle')
+    return with_version(jsonify({"message": "Vehicle updated successfully", "vehicle": vehicle}), vehicle['version']), 200
+
+@api.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
     vehicle = Vehicle.query.get(vehicle_id)
 
     if vehicle:
+        if not version_matches(vehicle.version):
+            return jsonify({"error": "Vehicle was modified, reload it and try again"}), 412
         db.session.delete(vehicle)
-        db.session.commit()
+        if not commit_versioned():
+            return jsonify({"error": "Vehicle was modified, reload it and try again"}), 412
+        response_cache.bump('vehicle')
         return jsonify({"message": "Vehicle deleted successfully"}), 200
     else:
         return jsonify({"error": "Vehicle not found"}), 404
 
 
 
+# EndPoints AUTH
+
+@api.route('/login', methods=['POST'])
+def login_user():
+    return jsonify(login(request.get_json(silent=True))), 200
+
+@api.route('/logout', methods=['POST'])
+@auth_required
+def logout_user():
+    logout(g.user_id)
+    return jsonify({"message": "Logged out, every token of the user is revoked"}), 200
+
 # Endpoints Favorites
     
-@app.route('/users/<int:user_id>', methods=['GET'])
+@api.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     user = User.query.get(user_id)
     if user is None:
         return jsonify({"error": "User not found"}), 404
     return jsonify(user.serialize()), 200
 
-@app.route('/users/<int:user_id>/favorites', methods=['GET'])
+@api.route('/users/<int:user_id>/favorites', methods=['GET'])
+@owner_required
 def get_user_favorites(user_id):
-    user_id = () # Vacío pq no sabemos el id de usuario
-    user_favorites = Favorites.query.filter_by(user_id = user_id).all()
-    serialized_favorites = [favorite.serialize() for favorite in user_favorites]
+    user_favorites = Favorites.with_targets().filter_by(user_id = user_id).all()
+    serialized_favorites = [favorite.serialize_expanded() for favorite in user_favorites]
+    # favorites queued by the write-behind queue and not written yet
+    serialized_favorites = favorites_queue.overlay_favorites(user_id, serialized_favorites, db.session.get)
     return jsonify(serialized_favorites), 200
 
 
+@api.route('/users/<int:user_id>/favorites/summary', methods=['GET'])
+@owner_required
+def get_user_favorites_summary(user_id):
+    document = favorites_queue.overlay_document(user_id, FavoritesDocument.fetch(user_id), db.session.get)
+    return jsonify(document), 200
+
 # Characters Favorites EndPoints
 
-@app.route('/favorite/characters/<int:character_id>', methods=['GET'])
+@api.route('/favorite/characters/<int:character_id>', methods=['GET'])
+@auth_required
 def get_character_favorite(character_id):
-    user_id = ()
-    favorite_character = Favorites.query.filter_by(user_id=user_id, character_id=character_id).first()
+    user_id = g.user_id
+    pending = favorites_queue.pending_operation(user_id, 'character_id', character_id)
+    if pending == 'add':
+        return jsonify({"id": None, "pending": True}), 200
+    favorite_character = None if pending == 'remove' else Favorites.query.filter_by(user_id=user_id, character_id=character_id).first()
 
     if favorite_character:
         return jsonify(favorite_character.serialize()), 200
     else:
         return jsonify({"error": "Character not found in favorites"}), 404
 
-@app.route('/favorite/characters/<int:character_id>', methods=['POST'])
+@api.route('/favorite/characters/<int:character_id>', methods=['POST'])
+@auth_required
 def add_character_favorite(character_id):
-    user_id = ()
-    existing_favorite = Favorites.query.filter_by(user_id = user_id, character_id = character_id).first()
+    user_id = g.user_id
+    # no favorite of a missing character, also not a queued one that the flush would drop
+    if db.session.get(Character, character_id) is None:
+        return jsonify({"error": "Character not found"}), 404
+    if favorites_queue.enabled:
+        if favorites_queue.is_favorite(user_id, 'character_id', character_id):
+            return jsonify({"message": "Character is already a favorite"}), 200
+        favorites_queue.add(user_id, 'character_id', character_id)
+        return jsonify({"message": "Character will be added to favorites"}), 202
+
+    favorite_id = Favorites.add(user_id, 'character_id', character_id)
 
-    if existing_favorite:
+    if favorite_id is None:
         return jsonify({"message": "Character is already a favorite"}), 200
 
-    new_favorite = Favorites(user_id = user_id, character_id = character_id)
-    db.session.add(new_favorite)
+    FavoritesDocument.add_target(user_id, 'character_id', character_id, favorite_id)
     db.session.commit()
-    return jsonify({"message": "Character added to favorites successfully", "favorite": new_favorite.serialize()}), 200
+    return jsonify({"message": "Character added to favorites successfully", "favorite": {"id": favorite_id}}), 200
 
-@app.route('/favorite/characters/<int:character_id>', methods=['DELETE'])
+@api.route('/favorite/characters/<int:character_id>', methods=['DELETE'])
+@auth_required
 def delete_character_favorite(character_id):
-    user_id = ()
+    user_id = g.user_id
+    if favorites_queue.enabled:
+        if not favorites_queue.is_favorite(user_id, 'character_id', character_id):
+            return jsonify({"error": "Character not found in favorites"}), 404
+        favorites_queue.remove(user_id, 'character_id', character_id)
+        return jsonify({"message": "Character will be removed from favorites"}), 202
+
     favorite_to_delete = Favorites.query.filter_by(user_id = user_id, character_id = character_id).first()
 
     if favorite_to_delete:
         db.session.delete(favorite_to_delete)
+        FavoritesDocument.remove_target(user_id, 'character_id', character_id)
         db.session.commit()
         return jsonify({"message": "Character removed from favorites successfully"}), 200
     else:
@@ -303,37 +535,57 @@ def delete_character_favorite(character_id):
 
 # Planets Favorites EndPoints
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['GET'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['GET'])
+@auth_required
 def get_planet_favorite(planet_id):
-    user_id = ()
-    favorite_planet = Favorites.query.filter_by(user_id=user_id, planet_id=planet_id).first()
+    user_id = g.user_id
+    pending = favorites_queue.pending_operation(user_id, 'planet_id', planet_id)
+    if pending == 'add':
+        return jsonify({"id": None, "pending": True}), 200
+    favorite_planet = None if pending == 'remove' else Favorites.query.filter_by(user_id=user_id, planet_id=planet_id).first()
 
     if favorite_planet:
         return jsonify(favorite_planet.serialize()), 200
     else:
         return jsonify({"error": "Planet not found in favorites"}), 404
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@auth_required
 def add_planet_favorite(planet_id):
-    user_id = ()
-    existing_favorite = Favorites.query.filter_by(user_id = user_id, planet_id = planet_id).first()
+    user_id = g.user_id
+    # no favorite of a missing planet, also not a queued one that the flush would drop
+    if db.session.get(Planet, planet_id) is None:
+        return jsonify({"error": "Planet not found"}), 404
+    if favorites_queue.enabled:
+        if favorites_queue.is_favorite(user_id, 'planet_id', planet_id):
+            return jsonify({"message": "Planet is already a favorite"}), 200
+        favorites_queue.add(user_id, 'planet_id', planet_id)
+        return jsonify({"message": "Planet will be added to favorites"}), 202
 
-    if existing_favorite:
-        return jsonify({"message": "Planet is already a favorite"}), 200
+    favorite_id = Favorites.add(user_id, 'planet_id', planet_id)
 
-    new_favorite = Favorites(user_id = user_id, planet_id = planet_id)
+    if favorite_id is None:
+        return jsonify({"message": "Planet is already a favorite"}), 200
 
-    db.session.add(new_favorite)
+    FavoritesDocument.add_target(user_id, 'planet_id', planet_id, favorite_id)
     db.session.commit()
-    return jsonify({"message": "Planet added to favorites successfully", "favorite": new_favorite.serialize()}), 200
+    return jsonify({"message": "Planet added to favorites successfully", "favorite": {"id": favorite_id}}), 200
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@auth_required
 def delete_planet_favorite(planet_id):
-    user_id = ()
+    user_id = g.user_id
+    if favorites_queue.enabled:
+        if not favorites_queue.is_favorite(user_id, 'planet_id', planet_id):
+            return jsonify({"error": "Planet not found in favorites"}), 404
+        favorites_queue.remove(user_id, 'planet_id', planet_id)
+        return jsonify({"message": "Planet will be removed from favorites"}), 202
+
     favorite_to_delete = Favorites.query.filter_by(user_id = user_id, planet_id = planet_id).first()
 
     if favorite_to_delete:
         db.session.delete(favorite_to_delete)
+        FavoritesDocument.remove_target(user_id, 'planet_id', planet_id)
         db.session.commit()
         return jsonify({"message": "Planet removed from favorites successfully"}), 200
     else:
@@ -342,37 +594,57 @@ def delete_planet_favorite(planet_id):
 
 # Vehicles Favorites EndPoints
 
-@app.route('/favorite/vehicle/<int:vehicle_id>', methods=['GET'])
+@api.route('/favorite/vehicle/<int:vehicle_id>', methods=['GET'])
+@auth_required
 def get_vehicle_favorite(vehicle_id):
-    user_id = ()
-    favorite_vehicle = Favorites.query.filter_by(user_id=user_id, vehicle_id=vehicle_id).first()
+    user_id = g.user_id
+    pending = favorites_queue.pending_operation(user_id, 'vehicle_id', vehicle_id)
+    if pending == 'add':
+        return jsonify({"id": None, "pending": True}), 200
+    favorite_vehicle = None if pending == 'remove' else Favorites.query.filter_by(user_id=user_id, vehicle_id=vehicle_id).first()
 
     if favorite_vehicle:
         return jsonify(favorite_vehicle.serialize()), 200
     else:
         return jsonify({"error": "Vehicle not found in favorites"}), 404
 
-@app.route('/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
+@api.route('/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
+@auth_required
 def add_vehicle_favorite(vehicle_id):
-    user_id = ()
-    existing_favorite = Favorites.query.filter_by(user_id=user_id, vehicle_id=vehicle_id).first()
+    user_id = g.user_id
+    # no favorite of a missing vehicle, also not a queued one that the flush would drop
+    if db.session.get(Vehicle, vehicle_id) is None:
+        return jsonify({"error": "Vehicle not found"}), 404
+    if favorites_queue.enabled:
+        if favorites_queue.is_favorite(user_id, 'vehicle_id', vehicle_id):
+            return jsonify({"message": "Vehicle is already a favorite"}), 200
+        favorites_queue.add(user_id, 'vehicle_id', vehicle_id)
+        return jsonify({"message": "Vehicle will be added to favorites"}), 202
 
-    if existing_favorite:
-        return jsonify({"message": "Vehicle is already a favorite"}), 200
+    favorite_id = Favorites.add(user_id, 'vehicle_id', vehicle_id)
 
-    new_favorite = Favorites(user_id=user_id, vehicle_id=vehicle_id)
+    if favorite_id is None:
+        return jsonify({"message": "Vehicle is already a favorite"}), 200
 
-    db.session.add(new_favorite)
+    FavoritesDocument.add_target(user_id, 'vehicle_id', vehicle_id, favorite_id)
     db.session.commit()
-    return jsonify({"message": "Vehicle added to favorites successfully", "favorite": new_favorite.serialize()}), 200
+    return jsonify({"message": "Vehicle added to favorites successfully", "favorite": {"id": favorite_id}}), 200
 
-@app.route('/favorite/vehicle/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/favorite/vehicle/<int:vehicle_id>', methods=['DELETE'])
+@auth_required
 def delete_vehicle_favorite(vehicle_id):
-    user_id = ()
+    user_id = g.user_id
+    if favorites_queue.enabled:
+        if not favorites_queue.is_favorite(user_id, 'vehicle_id', vehicle_id):
+            return jsonify({"error": "Vehicle not found in favorites"}), 404
+        favorites_queue.remove(user_id, 'vehicle_id', vehicle_id)
+        return jsonify({"message": "Vehicle will be removed from favorites"}), 202
+
     favorite_to_delete = Favorites.query.filter_by(user_id=user_id, vehicle_id=vehicle_id).first()
 
     if favorite_to_delete:
         db.session.delete(favorite_to_delete)
+        FavoritesDocument.remove_target(user_id, 'vehicle_id', vehicle_id)
         db.session.commit()
         return jsonify({"message": "Vehicle removed from favorites successfully"}), 200
     else:
@@ -382,5 +654,5 @@ def delete_vehicle_favorite(vehicle_id):
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
 
@@ -0,0 +1,253 @@
+"""
+ASGI entry point. The catalog and favorites reads run as async handlers on an AsyncSession,
+so a worker keeps serving while it waits on the database; every other route (writes, admin,
+sitemap...) is delegated to the Flask app from app.py. The async handlers run inside a request
+context of that app, so its before/after request hooks (CORS, compression, profiling...) apply
+to their responses as well.
+
+    $ uvicorn asgi:application --app-dir src
+    $ SERVER_MODE=asgi gunicorn -c src/gunicorn.conf.py
+
+Needs `uvicorn` and `asgiref`, plus `asyncpg` (Postgres) or `aiosqlite` (SQLite).
+"""
+import io
+import re
+import sys
+from urllib.parse import parse_qsl, urlencode
+from flask import Response, g, jsonify, request
+from werkzeug.datastructures import MultiDict
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from auth import authenticate_owner
+from cache import response_cache, cache_key, entry_response, replica_is_fresh
+from favorites_queue import favorites_queue
+from pool import engine_options
+from replicas import replica_router
+from patch import version_etag
+from serializers import Includes, ListQuery, field_spec, included_resources, project, rows_to_dicts
+from utils import APIException
+from models import User, Character, Planet, Vehicle, Favorites, FavoritesDocument
+
+ASYNC_DRIVERS = (
+    ('postgresql://', 'postgresql+asyncpg://'),
+    ('sqlite://', 'sqlite+aiosqlite://'),
+    ('mysql://', 'mysql+aiomysql://'),
+)
+
+def async_database_url(url):
+    for sync_prefix, async_prefix in ASYNC_DRIVERS:
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+def async_engine_options(url):
+    # same pool sizing as the sync engine, the async engine brings its own pool class
+    options = engine_options(url)
+    options.pop('poolclass', None)
+    options.pop('connect_args', None)
+    return options
+
+
+app = create_app(migrations=False)
+database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+engine = create_async_engine(async_database_url(database_uri), **async_engine_options(database_uri))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+# DATABASE_REPLICA_URLS, routed like the Flask app: see replicas.py
+replica_engines = {}
+for name, url in zip(replica_router.names, replica_router.urls):
+    replica_engines[name] = create_async_engine(async_database_url(url), **async_engine_options(url))
+    event.listen(replica_engines[name].sync_engine, 'handle_error', replica_router.on_error(name))
+flask_application = WsgiToAsgi(app)
+
+# resource name -> (model, cache key, not found message), cached like the Flask views
+COLLECTIONS = {
+    'users': (User, None, "User not found"),
+    'characters': (Character, 'character', "Character not found"),
+    'planets': (Planet, 'planet', "Planet not found"),
+    'vehicles': (Vehicle, 'vehicle', "Vehicle not found"),
+}
+LIST_ROUTE = re.compile(r'^/(users|characters|planets|vehicles)/?$')
+ITEM_ROUTE = re.compile(r'^/(users|characters|planets|vehicles)/(\d+)/?$')
+FAVORITES_ROUTE = re.compile(r'^/users/(\d+)/favorites/?$')
+
+def json_body(obj):
+    return app.json.dumps_bytes(obj) + b'\n'
+
+def wsgi_environ(scope):
+    # the WSGI environ of an ASGI request without a body, for a Flask request context
+    root_path = scope.get('root_path', '')
+    path = scope['path'][len(root_path):] if scope['path'].startswith(root_path) else scope['path']
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin1'),
+        'PATH_INFO': path.encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': (scope.get('client') or ('',))[0],
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin1')
+        environ[key] = '%s,%s' % (environ[key], value) if key in environ else value
+    return environ
+
+async def send_response(send, response):
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+async def include_related(session, includes, ids, items):
+    if includes:
+        items_by_id = includes.prepare(ids, items)
+        for name, stmt in includes.statements(ids):
+            includes.attach(items_by_id, name, (await session.execute(stmt)).all())
+    return items
+
+async def list_view(session, model, path, args):
+    query = ListQuery(model, args)
+    cursor_row = None
+    if query.needs_cursor_value:
+        cursor_row = (await session.execute(query.cursor_statement())).first()
+    rows = (await session.execute(query.statement(cursor_row))).all()
+    items = await include_related(session, query.includes, [row[0] for row in rows], query.to_dicts(rows))
+
+    headers = []
+    next_cursor = query.next_cursor(rows)
+    if next_cursor is not None:
+        next_args = [(key, value) for key, value in args.items(multi=True) if key != 'after']
+        next_args.append(('after', next_cursor))
+        headers.append(('X-Next-Cursor', str(next_cursor)))
+        headers.append(('Link', '<%s?%s>; rel="next"' % (path, urlencode(next_args))))
+    return 200, json_body(items), headers
+
+async def item_view(session, model, item_id, not_found, args):
+    includes = Includes(model, args)
+    keys = tuple(field_spec(model))
+    row = (await session.execute(project(model, keys).where(model.id == item_id))).first()
+    if row is None:
+        return 404, json_body({"error": not_found}), []
+    item = (await include_related(session, includes, [item_id], rows_to_dicts(keys, [row])))[0]
+    # same ETag as item_response(): the version of the row, unless other rows are included
+    headers = [('ETag', version_etag(item['version']))] if 'version' in item and not includes else []
+    return 200, json_body(item), headers
+
+async def favorites_view(session, user_id):
+    # same check as @owner_required, the user status is cached so this rarely reads the database
+    authenticate_owner(user_id)
+    stmt = select(Favorites).options(*Favorites.target_loaders()).filter_by(user_id=user_id)
+    favorites = [favorite.serialize_expanded() for favorite in (await session.execute(stmt)).scalars().all()]
+    if favorites_queue.enabled:
+        # targets of the favorites queued and not written yet
+        models = {column: model for _, column, _, model in FavoritesDocument.TARGETS}
+        targets = {}
+        for (column, target_id), operation in favorites_queue.overlay(user_id).items():
+            if operation == 'add':
+                targets[models[column], target_id] = await session.get(models[column], target_id)
+        favorites = favorites_queue.overlay_favorites(user_id, favorites, lambda model, id: targets.get((model, id)))
+    return 200, json_body(favorites), []
+
+def route(path, args):
+    """
+    Returns (view, cache resource, model) for the routes served asynchronously,
+    or None to hand the request over to Flask.
+    """
+    match = LIST_ROUTE.match(path)
+    if match and 'stream' not in args:
+        model, resource, _ = COLLECTIONS[match.group(1)]
+        return (lambda session: list_view(session, model, path, args)), resource, model
+
+    match = FAVORITES_ROUTE.match(path)
+    if match:
+        user_id = int(match.group(1))
+        return (lambda session: favorites_view(session, user_id)), None, None
+
+    match = ITEM_ROUTE.match(path)
+    if match:
+        model, resource, not_found = COLLECTIONS[match.group(1)]
+        item_id = int(match.group(2))
+        return (lambda session: item_view(session, model, item_id, not_found, args)), resource, model
+    return None
+
+def read_session():
+    # a session on a replica, on the primary when the client has just written or no replica is up
+    if replica_router.enabled:
+        if replica_router.is_sticky_request():
+            replica_router.count('sticky_reads')
+        else:
+            # kept in g like the Flask views do, for the response cache
+            g.replica = name = replica_router.pick()
+            replica_router.count('replica_reads' if name else 'primary_reads')
+            if name is not None:
+                return Session(bind=replica_engines[name])
+    return Session()
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            for replica_engine in replica_engines.values():
+                await replica_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def async_response(view, resource, model, args):
+    """
+    The response of an async view, through the response cache shared with the Flask views.
+    Runs in the request context pushed by application().
+    """
+    if resource is not None and replica_router.is_sticky_request():
+        # a client that has just written skips the cache, like in cached()
+        resource = None
+    if resource is not None:
+        try:
+            related = included_resources(model, args)
+        except APIException as error:
+            return jsonify(error.to_dict()), error.status_code
+        key = cache_key(resource, request.full_path, related)
+        entry = response_cache.get(key)
+        if entry is not None:
+            return entry_response(entry)
+
+    try:
+        async with read_session() as session:
+            status, body, headers = await view(session)
+    except APIException as error:
+        return jsonify(error.to_dict()), error.status_code
+
+    if status != 200 or resource is None or not replica_is_fresh((resource,) + related):
+        return Response(body, status, headers, mimetype='application/json')
+    etag = next((value for name, value in headers if name == 'ETag'), None)
+    headers = [(name, value) for name, value in headers if name != 'ETag']
+    entry = response_cache.store(key, body, [('Content-Type', 'application/json')] + headers, etag)
+    return entry_response(entry)
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        return await flask_application(scope, receive, send)
+
+    args = MultiDict(parse_qsl(scope['query_string'].decode(), keep_blank_values=True))
+    routed = route(scope['path'], args)
+    if routed is None:
+        return await flask_application(scope, receive, send)
+
+    with app.request_context(wsgi_environ(scope)):
+        response = app.preprocess_request()
+        if response is None:
+            response = await async_response(*routed, args)
+        response = app.process_response(app.make_response(response))
+    await send_response(send, response)
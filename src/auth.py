@@ -0,0 +1,180 @@
+"""
+Token authentication for the favorites endpoints, and for the admin-only export, import, bulk endpoints and Flask-Admin.
+
+    POST /login   {"email": ..., "password": ...}  -> {"token": ..., "expires_in": ...}
+    POST /logout  revokes every token of the user
+    then          Authorization: Bearer <token>
+
+Tokens are signed with FLASK_APP_KEY (itsdangerous), without it /login and every authenticated
+endpoint answer 503 rather than sign with a key anyone could know. They carry the user id and the user's
+token_version, so the signature and the expiry are checked without the database. Whether the
+user is still active and the token not revoked (token_version bumped by /logout) comes from a
+per-worker cache of (is_active, token_version, is_admin) refreshed every AUTH_CACHE_TTL seconds: an
+authenticated request only reads the user table once per user and TTL, and a deactivation or
+a logout reaches the other workers within that TTL.
+Password hashing is slow on purpose, it runs in a small thread pool (AUTH_HASH_WORKERS) so a
+burst of logins cannot take every CPU of the worker.
+"""
+import os
+import hmac
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from flask import current_app, g, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from werkzeug.security import check_password_hash, generate_password_hash
+from utils import APIException
+from models import db, User
+
+TOKEN_MAX_AGE = int(os.getenv('AUTH_TOKEN_MAX_AGE', 86400))
+TOKEN_SALT = 'auth-token'
+
+hash_pool = ThreadPoolExecutor(max_workers=int(os.getenv('AUTH_HASH_WORKERS', 2)), thread_name_prefix='password-hash')
+
+def is_hashed(stored):
+    return stored.startswith(('scrypt:', 'pbkdf2:'))
+
+def hash_password(password):
+    return hash_pool.submit(generate_password_hash, password).result()
+
+def password_matches(stored, password):
+    if is_hashed(stored):
+        return hash_pool.submit(check_password_hash, stored, password).result()
+    # password saved in clear before hashing was added (or through the admin), hashed on login
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+@lru_cache(maxsize=None)
+def dummy_hash():
+    # checked when the email is unknown, so that takes as long as a wrong password
+    return hash_password('dummy password')
+
+class UserStatusCache:
+    """
+    user id -> (is_active, token_version, is_admin), per worker, LRU + TTL like the response cache.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, status):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, status)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_status_cache = UserStatusCache(
+    max_entries=int(os.getenv('AUTH_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', 30)),
+)
+
+def serializer():
+    if not current_app.secret_key:
+        raise APIException("Authentication is not configured, FLASK_APP_KEY is not set", status_code=503)
+    return URLSafeTimedSerializer(current_app.secret_key, salt=TOKEN_SALT)
+
+def issue_token(user):
+    return serializer().dumps({'uid': user.id, 'tv': user.token_version})
+
+def user_status(user_id):
+    status = user_status_cache.get(user_id)
+    if status is None:
+        row = db.session.execute(db.select(User.is_active, User.token_version, User.is_admin).where(User.id == user_id)).first()
+        status = (bool(row.is_active), row.token_version, bool(row.is_admin)) if row else (False, None, False)
+        user_status_cache.set(user_id, status)
+    return status
+
+def verify_token(token):
+    try:
+        payload = serializer().loads(token, max_age=TOKEN_MAX_AGE)
+    except SignatureExpired:
+        raise APIException("Token expired, log in again", status_code=401)
+    except BadSignature:
+        raise APIException("Invalid token", status_code=401)
+    is_active, token_version, _ = user_status(payload['uid'])
+    if not is_active or token_version != payload['tv']:
+        raise APIException("Token revoked, log in again", status_code=401)
+    return payload['uid']
+
+def authenticate():
+    # id of the user of the Bearer token of the request, also kept in g.user_id
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise APIException("Missing Authorization: Bearer <token> header", status_code=401)
+    g.user_id = verify_token(token.strip())
+    return g.user_id
+
+def authenticate_owner(user_id):
+    # the routes under /users/<user_id>/ only answer that user
+    if authenticate() != user_id:
+        raise APIException("Not allowed for another user", status_code=403)
+
+def auth_required(view):
+    # g.user_id is the id of the authenticated user
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        authenticate()
+        return view(*args, **kwargs)
+    return wrapper
+
+def owner_required(view):
+    # auth_required, and the user_id of the URL must be the authenticated user
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        authenticate_owner(kwargs['user_id'])
+        return view(*args, **kwargs)
+    return wrapper
+
+def admin_required(view):
+    # auth_required, and the user must have is_admin
+    @auth_required
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not user_status(g.user_id)[2]:
+            raise APIException("Admin access required", status_code=403)
+        return view(*args, **kwargs)
+    return wrapper
+
+def login(body):
+    if not isinstance(body, dict) or not body.get('email') or not body.get('password'):
+        raise APIException("email and password are required")
+    if not isinstance(body['email'], str) or not isinstance(body['password'], str):
+        raise APIException("email and password must be strings")
+    user = User.query.filter_by(email=body['email']).first()
+    if user is None:
+        password_matches(dummy_hash(), body['password'])
+        raise APIException("Wrong email or password", status_code=401)
+    if not password_matches(user.password, body['password']) or not user.is_active:
+        raise APIException("Wrong email or password", status_code=401)
+    if not is_hashed(user.password):
+        user.password = hash_password(body['password'])
+        db.session.commit()
+    user_status_cache.set(user.id, (True, user.token_version, user.is_admin))
+    return {'token': issue_token(user), 'expires_in': TOKEN_MAX_AGE}
+
+def logout(user_id):
+    db.session.execute(db.update(User).where(User.id == user_id).values(token_version=User.token_version + 1))
+    db.session.commit()
+    user_status_cache.invalidate(user_id)
@@ -0,0 +1,118 @@
+import json
+from flask import request
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException
+from schemas import get_schema
+from models import db, dialect_insert
+
+BULK_BATCH_SIZE = 500
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-seq')
+
+def iter_request_rows():
+    """
+    Yields (row, error) tuples from the request body, which can be a JSON array
+    or an NDJSON stream (one object per line, read lazily from the socket).
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, "Invalid JSON: %s" % e
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            raise APIException("Body must be a JSON array or an NDJSON stream")
+        for row in rows:
+            yield row, None
+
+def upsert_statement(model, columns):
+    # INSERT ... ON CONFLICT (id) DO UPDATE for the columns present in the rows
+    table = model.__table__
+    stmt = dialect_insert(table)
+    updates = [column for column in columns if column not in ('id', 'version')]
+    # an updated row of a Versioned model gets a new version, whatever the row says
+    bump = {'version': table.c.version + 1} if 'version' in table.c and updates else {}
+
+    if hasattr(stmt, 'on_conflict_do_update'):
+        if not updates:
+            return stmt.on_conflict_do_nothing(index_elements=['id'])
+        return stmt.on_conflict_do_update(
+            index_elements=['id'],
+            set_=dict({column: stmt.excluded[column] for column in updates}, **bump),
+        )
+    if hasattr(stmt, 'on_duplicate_key_update'):
+        return stmt.on_duplicate_key_update(dict({column: stmt.inserted[column] for column in updates or ['id']}, **bump))
+    return stmt
+
+def validate_values(model, row):
+    columns = model.__table__.columns
+    for key, value in row.items():
+        if key not in columns:
+            return "Unknown field: %s" % key
+        enums = getattr(columns[key].type, 'enums', None)
+        if enums and value is not None and value not in enums:
+            return "Invalid value for %s: %r" % (key, value)
+    return None
+
+def validate_row(model, row):
+    # the checks of the request bodies (types, lengths, enums, unknown fields) for the fields of the row
+    if not isinstance(row, dict):
+        return "Row must be a JSON object"
+    if 'id' not in row:
+        return "Missing field: id"
+    try:
+        get_schema(model, rows=True).convert(row)
+    except APIException as e:
+        return e.message
+    return None
+
+def db_error(error):
+    return str(getattr(error, 'orig', None) or error).strip()
+
+def flush_batch(model, batch, errors):
+    # Rows with the same set of keys share one executemany, the whole batch is one transaction
+    groups = {}
+    for index, row in batch:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    try:
+        for columns, rows in groups.items():
+            db.session.execute(upsert_statement(model, columns), rows)
+        db.session.commit()
+        return len(batch)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    # Something in the batch was rejected by the database, retry row by row to find out what
+    saved = 0
+    for index, row in batch:
+        try:
+            db.session.execute(upsert_statement(model, tuple(sorted(row))), [row])
+            db.session.commit()
+            saved += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.append({"index": index, "error": db_error(e)})
+    return saved
+
+def bulk_upsert(model, rows, batch_size=BULK_BATCH_SIZE):
+    saved = 0
+    errors = []
+    batch = []
+    for index, (row, error) in enumerate(rows):
+        error = error or validate_row(model, row)
+        if error:
+            errors.append({"index": index, "error": error})
+            continue
+        batch.append((index, row))
+        if len(batch) == batch_size:
+            saved += flush_batch(model, batch, errors)
+            batch = []
+    if batch:
+        saved += flush_batch(model, batch, errors)
+
+    errors.sort(key=lambda e: e["index"])
+    return {"saved": saved, "errors": errors}
@@ -0,0 +1,139 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+from compression import negotiate, encoded_body
+from replicas import replica_router
+
+class ResponseCache:
+    """
+    In-process LRU + TTL cache of serialized GET responses.
+    Entries are keyed by (resource, table versions, path), so bumping the version of a table
+    on every write invalidates all of its entries at once. The cache lives per worker process,
+    the TTL bounds how long another worker can serve a stale payload.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        # resource -> time.monotonic() of its last bump
+        self._bumped = {}
+        self._lock = threading.Lock()
+
+    def version(self, resource):
+        return self._versions.get(resource, 0)
+
+    def bump(self, resource):
+        with self._lock:
+            self._versions[resource] = self._versions.get(resource, 0) + 1
+            self._bumped[resource] = time.monotonic()
+
+    def bumped_within(self, resources, seconds):
+        since = time.monotonic() - seconds
+        return any(self._bumped.get(resource, since) > since for resource in resources)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        entry['expires'] = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def store(self, key, body, headers, etag=None):
+        # the ETag set by the view (e.g. the version of a row) or a hash of the body
+        entry = {
+            'body': body,
+            'etag': etag or hashlib.sha1(body).hexdigest(),
+            'headers': headers,
+        }
+        self.set(key, entry)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 60)),
+)
+
+# headers worth replaying from a cached response
+CACHED_HEADERS = ('Content-Type', 'Link', 'X-Next-Cursor')
+
+def entry_response(entry):
+    """
+    Response for a stored entry: the body in the encoding the client prefers,
+    with a strong ETag per encoding and a 304 when If-None-Match matches.
+    """
+    encoding = negotiate(request.accept_encodings, len(entry['body']))
+    response = make_response(encoded_body(entry, encoding), 200, entry['headers'])
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        response.set_etag(entry['etag'])
+    else:
+        # each encoding is its own representation and gets its own strong ETag
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag('%s-%s' % (entry['etag'], encoding))
+    return response.make_conditional(request)
+
+def cache_key(resource, path, related=()):
+    # the versions of every table the response is built from
+    return (resource, tuple(response_cache.version(name) for name in (resource,) + tuple(related)), path)
+
+def replica_is_fresh(resources):
+    # a response read from a replica within REPLICA_STICKY_SECONDS of a write to its tables
+    # may miss that write, it must not be cached under their new version
+    if not g.get('replica'):
+        return True
+    return not response_cache.bumped_within(resources, replica_router.sticky_seconds)
+
+def cached(resource, related=None):
+    """
+    Read-through cache for GET endpoints of a catalog resource.
+    Successful responses are stored with a strong ETag and requests with a matching
+    If-None-Match get a 304 without touching the database. Compressed copies of the body
+    are added to the entry the first time a client asks for them.
+    related(args) names the other tables a response reads (?include=), their writes
+    invalidate it too.
+    With read replicas, a client that has just written reads from the primary and skips the
+    cache, and a body read from a replica is not stored while that replica may still miss the
+    last write (see replicas.py).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if replica_router.is_sticky_request():
+                return view(*args, **kwargs)
+            resources = (resource,) + tuple(related(request.args) if related else ())
+            key = cache_key(resource, request.full_path, resources[1:])
+            entry = response_cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                if not replica_is_fresh(resources):
+                    return response
+                headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+                entry = response_cache.store(key, response.get_data(), headers, response.get_etag()[0])
+            return entry_response(entry)
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# responses smaller than this go out uncompressed, the headers would cost more than the savings
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain')
+
+def gzip_compress(body):
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+COMPRESSORS = {'gzip': gzip_compress}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+if zstandard is not None:
+    COMPRESSORS['zstd'] = lambda body: zstandard.ZstdCompressor(level=3).compress(body)
+
+# server preference when the client accepts several encodings with the same quality
+PREFERENCE = [encoding for encoding in ('zstd', 'br', 'gzip') if encoding in COMPRESSORS]
+
+def negotiate(accept_encodings, size):
+    # accept_encodings is a werkzeug Accept, e.g. request.accept_encodings
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    return accept_encodings.best_match(PREFERENCE)
+
+def compress(body, encoding):
+    return COMPRESSORS[encoding](body)
+
+def encoded_body(entry, encoding):
+    """
+    Body of a cache entry in the given encoding. The compressed copies are kept in the entry
+    next to the plain body, so a payload is compressed once per write and not once per request.
+    """
+    if encoding is None:
+        return entry['body']
+    encoded = entry.setdefault('encoded', {})
+    if encoding not in encoded:
+        encoded[encoding] = compress(entry['body'], encoding)
+    return encoded[encoding]
+
+def setup_compression(app):
+    # Compression of the responses that are not served from the response cache
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        encoding = negotiate(request.accept_encodings, len(body))
+        if encoding is None:
+            return response
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
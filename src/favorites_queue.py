@@ -0,0 +1,207 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from models import db, Favorites, FavoritesDocument
+
+logger = logging.getLogger(__name__)
+
+class FavoritesQueue:
+    """
+    Optional write-behind queue for favorite adds and removes, enabled with FAVORITES_WRITE_BEHIND=1.
+    The handlers record the operation and answer 202; a background thread writes the pending
+    operations in one transaction every FAVORITES_FLUSH_MS (default 50), or as soon as
+    FAVORITES_FLUSH_SIZE (default 100) of them are waiting. Operations on the same
+    (user, target) coalesce, only the last one is written. Reads overlay the operations that
+    are not committed yet. The queue lives in the worker's memory: operations still pending
+    when a worker is killed (not stopped) are lost.
+    """
+
+    def __init__(self, enabled=False, flush_ms=50, flush_size=100):
+        self.enabled = enabled
+        self.flush_interval = flush_ms / 1000
+        self.flush_size = flush_size
+        self.app = None
+        # (user_id, column, target_id) -> 'add' or 'remove'
+        self._pending = OrderedDict()
+        self._flushing = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        self._stats = {
+            'enqueued': 0, 'coalesced': 0, 'flushes': 0, 'flushed': 0, 'failed': 0,
+            'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0,
+        }
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.stop)
+
+    def _start(self):
+        # started on first use, so every forked worker gets its own thread
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='favorites-queue', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, user_id, column, target_id, operation):
+        key = (user_id, column, target_id)
+        with self._condition:
+            self._start()
+            if key in self._pending:
+                self._stats['coalesced'] += 1
+            self._pending[key] = operation
+            self._pending.move_to_end(key)
+            self._stats['enqueued'] += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.flush_size:
+                self._condition.notify()
+
+    def add(self, user_id, column, target_id):
+        self.enqueue(user_id, column, target_id, 'add')
+
+    def remove(self, user_id, column, target_id):
+        self.enqueue(user_id, column, target_id, 'remove')
+
+    def overlay(self, user_id):
+        # {(column, target_id): operation} of a user, not committed yet
+        with self._condition:
+            operations = [self._flushing.items(), self._pending.items()]
+            return {(column, target_id): operation
+                    for items in operations for (user, column, target_id), operation in items if user == user_id}
+
+    def pending_operation(self, user_id, column, target_id):
+        key = (user_id, column, target_id)
+        with self._condition:
+            return self._pending.get(key) or self._flushing.get(key)
+
+    def is_favorite(self, user_id, column, target_id):
+        operation = self.pending_operation(user_id, column, target_id)
+        if operation is not None:
+            return operation == 'add'
+        return Favorites.query.filter_by(user_id=user_id, **{column: target_id}).first() is not None
+
+    def overlay_favorites(self, user_id, favorites, load):
+        """
+        Applies the pending operations to serialize_expanded() dicts read from the database.
+        load(model, id) returns the target of a pending add.
+        """
+        pending = self.overlay(user_id)
+        if not pending:
+            return favorites
+        result = []
+        for favorite in favorites:
+            key = next(((column, favorite[name]['id']) for _, column, name, _ in FavoritesDocument.TARGETS if favorite[name]), None)
+            if pending.pop(key, None) != 'remove':
+                result.append(favorite)
+        for _, column, name, model in FavoritesDocument.TARGETS:
+            for (pending_column, target_id), operation in pending.items():
+                target = load(model, target_id) if pending_column == column and operation == 'add' else None
+                if target is not None:
+                    favorite = {'id': None, 'user_id': user_id, 'character': None, 'planet': None, 'vehicle': None}
+                    favorite[name] = target.serialize()
+                    result.append(favorite)
+        return result
+
+    def overlay_document(self, user_id, document, load):
+        # same as overlay_favorites() for a FavoritesDocument
+        pending = self.overlay(user_id)
+        if not pending:
+            return document
+        document = dict(document, counts=dict(document['counts']))
+        for key, column, _, model in FavoritesDocument.TARGETS:
+            summaries = [summary for summary in document[key] if pending.get((column, summary['id'])) != 'remove']
+            present = {summary['id'] for summary in summaries}
+            for (pending_column, target_id), operation in pending.items():
+                if pending_column == column and operation == 'add' and target_id not in present:
+                    target = load(model, target_id)
+                    if target is not None:
+                        summaries.append(FavoritesDocument.summary(None, target))
+            document[key] = summaries
+            document['counts'][key] = len(summaries)
+        return document
+
+    @staticmethod
+    def write(user_id, column, target_id, operation):
+        if operation == 'add':
+            favorite_id = Favorites.add(user_id, column, target_id)
+            if favorite_id is not None:
+                FavoritesDocument.add_target(user_id, column, target_id, favorite_id)
+        else:
+            deleted = Favorites.query.filter_by(user_id=user_id, **{column: target_id}).delete(synchronize_session=False)
+            if deleted:
+                FavoritesDocument.remove_target(user_id, column, target_id)
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        failed = 0
+        with self.app.app_context():
+            try:
+                for key, operation in batch.items():
+                    self.write(*key, operation)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # retry one by one, an operation that fails must not drop the whole batch
+                for key, operation in batch.items():
+                    try:
+                        self.write(*key, operation)
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        failed += 1
+                        logger.warning("Dropped favorite %s %r: %s", operation, key, e)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._condition:
+            self._flushing = OrderedDict()
+            self._stats['flushes'] += 1
+            self._stats['flushed'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['last_flush_ms'] = elapsed
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed)
+            self._stats['total_flush_ms'] += elapsed
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # give the batch time to fill up, unless it is already full
+                if len(self._pending) < self.flush_size and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                self._flushing, self._pending = self._pending, OrderedDict()
+            try:
+                self.flush(self._flushing)
+            except Exception:
+                # the thread must outlive any error, or every later operation would only pile up
+                logger.exception("Favorites queue flush failed, %d operations dropped", len(self._flushing))
+                with self._condition:
+                    self._stats['failed'] += len(self._flushing)
+                    self._flushing = OrderedDict()
+
+    def stop(self):
+        # flushes what is still pending, called at exit
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=10)
+
+    def metrics(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['enabled'] = self.enabled
+            stats['depth'] = len(self._pending) + len(self._flushing)
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+
+favorites_queue = FavoritesQueue(
+    enabled=os.getenv('FAVORITES_WRITE_BEHIND', '0') == '1',
+    flush_ms=float(os.getenv('FAVORITES_FLUSH_MS', 50)),
+    flush_size=int(os.getenv('FAVORITES_FLUSH_SIZE', 100)),
+)
@@ -0,0 +1,13 @@
+# gunicorn settings, used by the Procfile and render.yaml: `gunicorn -c src/gunicorn.conf.py`
+# SERVER_MODE=wsgi (default) runs the Flask app on sync workers,
+# SERVER_MODE=asgi runs asgi.py on uvicorn workers (needs uvicorn, asgiref and asyncpg/aiosqlite).
+# Workers and bind address keep gunicorn's defaults: WEB_CONCURRENCY and PORT.
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'wsgi:application'
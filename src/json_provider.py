@@ -0,0 +1,76 @@
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+def available_backends():
+    backends = []
+    if orjson is not None:
+        backends.append('orjson')
+    if msgspec is not None:
+        backends.append('msgspec')
+    backends.append('stdlib')
+    return backends
+
+def pick_backend(name):
+    # "auto" takes the fastest library that is installed, an unavailable choice falls back to stdlib
+    backends = available_backends()
+    if name == 'auto':
+        return backends[0]
+    return name if name in backends else 'stdlib'
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson or msgspec when installed and falls back to
+    the standard library otherwise. Select it with JSON_BACKEND=auto|orjson|msgspec|stdlib;
+    JSON_SORT_KEYS=0 and JSON_COMPACT=1 skip key sorting and pretty-printing.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.backend = pick_backend(os.getenv('JSON_BACKEND', 'auto'))
+        self.sort_keys = os.getenv('JSON_SORT_KEYS', '1') != '0'
+        if os.getenv('JSON_COMPACT') is not None:
+            self.compact = os.getenv('JSON_COMPACT') != '0'
+        if self.backend == 'msgspec':
+            self._encoder = msgspec.json.Encoder(enc_hook=self.default, order='sorted' if self.sort_keys else None)
+
+    def dumps_bytes(self, obj, pretty=False):
+        if self.backend == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=self.default, option=option)
+        if self.backend == 'msgspec':
+            data = self._encoder.encode(obj)
+            return msgspec.json.format(data, indent=2) if pretty else data
+        if pretty:
+            return super().dumps(obj, indent=2).encode()
+        return super().dumps(obj, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        if self.backend == 'stdlib' or kwargs.keys() - {'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if self.backend == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        if self.backend == 'msgspec' and not kwargs:
+            return msgspec.json.decode(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self.dumps_bytes(obj, pretty) + b'\n', mimetype=self.mimetype)
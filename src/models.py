@@ -1,59 +1,111 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import delete, event, insert, inspect, select
+from sqlalchemy.orm import joinedload, declared_attr
+from replicas import RoutingSession, replica_router
 
-db = SQLAlchemy()
+# db.session sends the reads of GET requests to the replicas, see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
-class User(db.Model):
+def dialect_insert(table):
+    # INSERT construct of the current database, the one that knows about ON CONFLICT / ON DUPLICATE KEY.
+    # The dialect modules are imported on first use, not at startup
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects import sqlite
+        return sqlite.insert(table)
+    if dialect == 'mysql':
+        from sqlalchemy.dialects import mysql
+        return mysql.insert(table)
+    return insert(table)
+
+class Serializable:
+    # (json key, column) pairs, shared by serialize() and the column-projected
+    # list endpoints in serializers.py
+    serialize_fields = ()
+    filter_fields = ()
+    sort_fields = ('id',)
+    # columns matched by /search, the first one is the name shown in the results
+    search_fields = ()
+    # relationships the endpoints embed with ?include=
+    include_fields = ()
+
+    def serialize(self):
+        return {key: getattr(self, column) for key, column in self.serialize_fields}
+
+class Versioned:
+    # bumped on every write of the row, served as its ETag ("v3") and checked against If-Match
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    @declared_attr
+    def __mapper_args__(cls):
+        # the ORM adds "AND version = ?" to its UPDATE/DELETE and increments it
+        return {'version_id_col': cls.version}
+
+class User(Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     username = db.Column(db.String(50), nullable = False, unique = True)
-    password = db.Column(db.String(80), unique=False, nullable=False)
+    # a werkzeug hash, see auth.py
+    password = db.Column(db.String(255), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
+    # bumped by /logout, tokens issued with an older version are revoked
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # can export and import whole tables
+    is_admin = db.Column(db.Boolean(), nullable=False, default=False, server_default=db.false())
 
     def __repr__(self):
         return '<User %r>' % self.username
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-            # do not serialize the password, its a security breach
-        }
+    serialize_fields = (
+        ('id', 'id'),
+        ('email', 'email'),
+        # do not serialize the password, its a security breach
+    )
 
-class Character(db.Model):
+class Character(Versioned, Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), unique=True, nullable=False)
     birth_year = db.Column(db.String(50))
-    gender = db.Column(db.Enum('male', 'female', 'other', name = 'gender'), nullable=False)
-    height = db.Column(db.Integer)
+    gender = db.Column(db.Enum('male', 'female', 'other', name = 'gender'), nullable=False, index=True)
+    height = db.Column(db.Integer, index=True)
     weight = db.Column(db.Integer)
     eye_color = db.Column(db.Enum('blue', 'brown', 'green', 'black', 'other', name='eyes'), nullable=False)
     hair_color = db.Column(db.Enum('blond', 'brown', 'ginger', 'black', 'other', name = 'hair'), nullable=False)  
-    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
-    #planet = db.relationship(Planet)
+    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), index=True)
+    # the one-to-many sides are read-only, they only serve ?include=
+    planet = db.relationship('Planet', backref=db.backref('residents', viewonly=True))
 
     def __repr__(self):
         return '<Character %r>' % self.name
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'birth_year': self.birth_year,
-            'gender': self.gender,
-            'height': self.height,
-            'weight' : self.weight,
-            'eyes': self.eye_color,
-            'hair': self.hair_color,
-        }
-    
-class Planet(db.Model):
+    serialize_fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('birth_year', 'birth_year'),
+        ('gender', 'gender'),
+        ('height', 'height'),
+        ('weight', 'weight'),
+        ('eyes', 'eye_color'),
+        ('hair', 'hair_color'),
+        ('version', 'version'),
+    )
+    # query-string filters and sorts accepted by the list endpoint, all of them indexed
+    filter_fields = ('gender', 'planet_id')
+    sort_fields = ('id', 'name', 'height')
+    search_fields = ('name',)
+    include_fields = ('planet', 'vehicles')
+
+class Planet(Versioned, Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
-    diameter = db.Column(db.Integer)
-    climate = db.Column(db.Enum('temperate', 'tropical', 'arid', 'frozen', 'murky', name = 'climate'))
-    terrain = db.Column(db.Enum('jungle, rainforests', 'grasslands, mountains', 'ocean', 'desert', 'tundra', 'ice caves, mountain ranges', 'forests, mountains, lakes', 'swamp, jungles', 'other', name = 'terrain'))
+    diameter = db.Column(db.Integer, index=True)
+    climate = db.Column(db.Enum('temperate', 'tropical', 'arid', 'frozen', 'murky', name = 'climate'), index=True)
+    terrain = db.Column(db.Enum('jungle, rainforests', 'grasslands, mountains', 'ocean', 'desert', 'tundra', 'ice caves, mountain ranges', 'forests, mountains, lakes', 'swamp, jungles', 'other', name = 'terrain'), index=True)
     surface_water = db.Column(db.Integer)
-    population = db.Column(db.Integer)
+    population = db.Column(db.Integer, index=True)
     orbital_period = db.Column(db.Integer)
     rotation_period = db.Column(db.Integer)
     gravity = db.Column(db.String(50))
@@ -61,69 +113,254 @@ class Planet(db.Model):
     def __repr__(self):
         return '<Planet %r>' % self.name
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'diameter': self.diameter,
-            'climate': self.climate,
-            'terrain': self.terrain,
-            'surface_water' : self.surface_water,
-            'population': self.population,
-            'orbital_period': self.orbital_period,
-            'rotation_period': self.rotation_period,
-            'gravity' : self.gravity,
-        }
+    serialize_fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('diameter', 'diameter'),
+        ('climate', 'climate'),
+        ('terrain', 'terrain'),
+        ('surface_water', 'surface_water'),
+        ('population', 'population'),
+        ('orbital_period', 'orbital_period'),
+        ('rotation_period', 'rotation_period'),
+        ('gravity', 'gravity'),
+        ('version', 'version'),
+    )
+    filter_fields = ('climate', 'terrain')
+    sort_fields = ('id', 'name', 'diameter', 'population')
+    search_fields = ('name',)
+    include_fields = ('residents',)
 
-class Vehicle(db.Model):
+class Vehicle(Versioned, Serializable, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     model = db.Column(db.String(100))
     length = db.Column(db.Integer)
     cargo = db.Column(db.Integer)
-    speed = db.Column(db.Integer)
+    speed = db.Column(db.Integer, index=True)
     crew = db.Column(db.Integer)
     passengers = db.Column(db.Integer)
-    manufacturer = db.Column(db.Enum('Corellia Mining Corporation', 'SoroSuub Corporation', 'Incom Corporation', 'Sienar Fleet Systems', ' Ubrikkian Industries', name='manufacturer'))
-    character_id = db.Column(db.Integer, db.ForeignKey('character.id')) 
-    character = db.relationship(Character)
+    manufacturer = db.Column(db.Enum('Corellia Mining Corporation', 'SoroSuub Corporation', 'Incom Corporation', 'Sienar Fleet Systems', ' Ubrikkian Industries', name='manufacturer'), index=True)
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), index=True)
+    character = db.relationship(Character, backref=db.backref('vehicles', viewonly=True))
       
     def __repr__(self):
         return '<Vehicle %r>' % self.name
 
-    def serialize(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'model': self.model,
-            'length': self.length,
-            'cargo': self.cargo,
-            'speed': self.speed,
-            'crew': self.crew,
-            'passengers': self.passengers,
-            'manufacturer': self.manufacturer,
-        }
-    
-class Favorites(db.Model):
+    serialize_fields = (
+        ('id', 'id'),
+        ('name', 'name'),
+        ('model', 'model'),
+        ('length', 'length'),
+        ('cargo', 'cargo'),
+        ('speed', 'speed'),
+        ('crew', 'crew'),
+        ('passengers', 'passengers'),
+        ('manufacturer', 'manufacturer'),
+        ('version', 'version'),
+    )
+    filter_fields = ('manufacturer', 'character_id')
+    sort_fields = ('id', 'name', 'speed')
+    search_fields = ('name', 'model', 'manufacturer')
+    include_fields = ('character',)
+
+class Favorites(Serializable, db.Model):
+    # a user can favorite each character, planet or vehicle only once
+    __table_args__ = (
+        db.Index('uq_favorites_user_character', 'user_id', 'character_id', unique=True,
+                 postgresql_where=db.text('character_id IS NOT NULL'), sqlite_where=db.text('character_id IS NOT NULL')),
+        db.Index('uq_favorites_user_planet', 'user_id', 'planet_id', unique=True,
+                 postgresql_where=db.text('planet_id IS NOT NULL'), sqlite_where=db.text('planet_id IS NOT NULL')),
+        db.Index('uq_favorites_user_vehicle', 'user_id', 'vehicle_id', unique=True,
+                 postgresql_where=db.text('vehicle_id IS NOT NULL'), sqlite_where=db.text('vehicle_id IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship(User)
 
-    character_id = db.Column(db.Integer, db.ForeignKey('character.id'))
+    character_id = db.Column(db.Integer, db.ForeignKey('character.id'), index=True)
     character = db.relationship(Character)
 
-    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
+    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), index=True)
     planet = db.relationship(Planet)
     
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'))
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), index=True)
     vehicle = db.relationship(Vehicle)
 
     def __repr__(self):
         return '<Favorites %r>' % self.user_id
 
-    def serialize(self):
+    serialize_fields = (
+        ('id', 'id'),
+    )
+
+    def serialize_expanded(self):
+        # expects character, planet and vehicle to be eager loaded, see Favorites.with_targets()
         return {
-            'id': self.id
+            'id': self.id,
+            'user_id': self.user_id,
+            'character': self.character.serialize() if self.character else None,
+            'planet': self.planet.serialize() if self.planet else None,
+            'vehicle': self.vehicle.serialize() if self.vehicle else None,
         }
-    
\ No newline at end of file
+
+    @classmethod
+    def add(cls, user_id, target, target_id):
+        """
+        Idempotent add in a single statement: INSERT ... ON CONFLICT DO NOTHING RETURNING id
+        against the partial unique index of the target column.
+        Returns the id of the new favorite, or None when the user already had it.
+        """
+        column = cls.__table__.c[target]
+        stmt = dialect_insert(cls.__table__).values({'user_id': user_id, target: target_id})
+        if db.session.get_bind().dialect.name == 'mysql':
+            result = db.session.execute(stmt.prefix_with('IGNORE'))
+            return result.inserted_primary_key[0] if result.rowcount else None
+        stmt = stmt.on_conflict_do_nothing(index_elements=['user_id', target], index_where=column.isnot(None))
+        return db.session.execute(stmt.returning(cls.id)).scalar()
+
+    @classmethod
+    def target_loaders(cls):
+        # many-to-one targets are joined in the same SELECT, so a user's favorites
+        # load in one query whatever their number
+        return (
+            joinedload(cls.character),
+            joinedload(cls.planet),
+            joinedload(cls.vehicle),
+        )
+
+    @classmethod
+    def with_targets(cls):
+        return cls.query.options(*cls.target_loaders())
+    
+
+class FavoritesDocument(db.Model):
+    """
+    Precomputed favorites of a user: counts per type and a summary of every target, kept up to
+    date by the favorite add/delete handlers so it is served with a single primary key lookup.
+    A missing row is rebuilt from Favorites on the next read. Renaming or deleting a target
+    drops the documents that embed it, see invalidate_documents() below.
+    """
+    # document key, favorites column, favorites relationship, target model
+    TARGETS = (
+        ('characters', 'character_id', 'character', Character),
+        ('planets', 'planet_id', 'planet', Planet),
+        ('vehicles', 'vehicle_id', 'vehicle', Vehicle),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    document = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return '<FavoritesDocument %r>' % self.user_id
+
+    @staticmethod
+    def summary(favorite_id, target):
+        return {'favorite_id': favorite_id, 'id': target.id if target else None, 'name': target.name if target else None}
+
+    @classmethod
+    def empty(cls, user_id):
+        document = {'user_id': user_id, 'counts': {}}
+        for key, _, _, _ in cls.TARGETS:
+            document[key] = []
+            document['counts'][key] = 0
+        return document
+
+    @classmethod
+    def build(cls, user_id):
+        document = cls.empty(user_id)
+        for favorite in Favorites.with_targets().filter_by(user_id=user_id).order_by(Favorites.id):
+            for key, column, relationship, _ in cls.TARGETS:
+                if getattr(favorite, column) is not None:
+                    document[key].append(cls.summary(favorite.id, getattr(favorite, relationship)))
+                    document['counts'][key] += 1
+        return document
+
+    @classmethod
+    def insert(cls, user_id, document):
+        """
+        INSERT ... ON CONFLICT DO NOTHING of a rebuilt document. Returns False when another
+        request stored the document of the user first, theirs is kept: two requests that both
+        found no row do not fail on the primary key.
+        """
+        stmt = dialect_insert(cls.__table__).values(user_id=user_id, document=document)
+        if db.session.get_bind().dialect.name == 'mysql':
+            return bool(db.session.execute(stmt.prefix_with('IGNORE')).rowcount)
+        stmt = stmt.on_conflict_do_nothing(index_elements=['user_id'])
+        return db.session.execute(stmt.returning(cls.user_id)).scalar() is not None
+
+    @classmethod
+    def fetch(cls, user_id):
+        row = db.session.get(cls, user_id)
+        if row is None and replica_router.use_primary():
+            # maybe only missing on a lagging replica, and never rebuilt from its data
+            row = db.session.get(cls, user_id)
+        if row is not None:
+            return row.document
+        document = cls.build(user_id)
+        cls.insert(user_id, document)
+        db.session.commit()
+        return document
+
+    @classmethod
+    def locked(cls, user_id):
+        return cls.query.filter_by(user_id=user_id).with_for_update().first()
+
+    @classmethod
+    def add_target(cls, user_id, column, target_id, favorite_id):
+        row = cls.locked(user_id)
+        if row is None:
+            # the rebuilt document already has the new favorite
+            if cls.insert(user_id, cls.build(user_id)):
+                return
+            # stored by another request in the meantime, add to that one
+            row = cls.locked(user_id)
+        key, _, _, model = next(target for target in cls.TARGETS if target[1] == column)
+        if any(summary['favorite_id'] == favorite_id for summary in row.document[key]):
+            return
+        target = db.session.get(model, target_id)
+        document = dict(row.document)
+        document[key] = document[key] + [cls.summary(favorite_id, target)]
+        document['counts'] = dict(document['counts'], **{key: len(document[key])})
+        # JSON columns do not track in-place changes, assign a new document
+        row.document = document
+
+    @classmethod
+    def remove_target(cls, user_id, column, target_id):
+        row = cls.locked(user_id)
+        if row is None:
+            return
+        key = next(target[0] for target in cls.TARGETS if target[1] == column)
+        document = dict(row.document)
+        document[key] = [summary for summary in document[key] if summary['id'] != target_id]
+        document['counts'] = dict(document['counts'], **{key: len(document[key])})
+        row.document = document
+
+    @classmethod
+    def invalidate(cls, column, target_id=None, connection=None):
+        # a renamed or deleted target drops the documents that embed it, they are rebuilt on read;
+        # without target_id every document embedding that type is dropped (bulk loads).
+        # connection is the one of the flush when called from a mapper event
+        users = select(Favorites.user_id).where(getattr(Favorites, column).isnot(None))
+        if target_id is not None:
+            users = users.where(getattr(Favorites, column) == target_id)
+        (connection or db.session).execute(delete(cls.__table__).where(cls.user_id.in_(users)))
+
+def invalidate_documents(column):
+    # mapper events of Character, Planet and Vehicle: every ORM rename or delete (PUT, DELETE,
+    # Flask-Admin...) drops the documents. The UPDATE statements of PATCH and /bulk do not go
+    # through the mapper, their handlers call FavoritesDocument.invalidate() themselves.
+    def after_update(mapper, connection, target):
+        if inspect(target).attrs.name.history.has_changes():
+            FavoritesDocument.invalidate(column, target.id, connection)
+
+    def after_delete(mapper, connection, target):
+        FavoritesDocument.invalidate(column, target.id, connection)
+    return after_update, after_delete
+
+for _, column, _, model in FavoritesDocument.TARGETS:
+    after_update, after_delete = invalidate_documents(column)
+    event.listen(model, 'after_update', after_update)
+    event.listen(model, 'after_delete', after_delete)
@@ -0,0 +1,98 @@
+import re
+from flask import request, jsonify
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from utils import APIException
+from bulk import db_error, validate_values
+from serializers import Includes, field_spec, include_related, project, rows_to_dicts
+from models import db
+
+# ETag of a Versioned row, "v3"; the response cache appends the encoding of compressed copies ("v3-gzip")
+VERSION_ETAG = re.compile(r'^v(\d+)(?:-\w+)?$')
+
+def version_etag(version):
+    return 'v%d' % version
+
+def if_match_versions():
+    """
+    Versions accepted by the If-Match header of the request, or None when the request
+    has no precondition (no If-Match, or If-Match: *).
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    matches = [VERSION_ETAG.match(etag) for etag in if_match.as_set()]
+    return [int(match.group(1)) for match in matches if match]
+
+def version_matches(version):
+    versions = if_match_versions()
+    return versions is None or version in versions
+
+def commit_versioned():
+    """
+    Commits an ORM write of a Versioned row. Returns False, after a rollback, when another
+    request bumped the version since the row was read (the "AND version = ?" matched nothing).
+    """
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        return False
+    return True
+
+def with_version(response, version):
+    response.set_etag(version_etag(version))
+    return response
+
+def item_response(item):
+    # GET of a Versioned row, its version is the ETag that PUT and PATCH compare If-Match with
+    includes = Includes(type(item), request.args)
+    body = include_related(includes, [item.id], [item.serialize()])[0]
+    if includes:
+        # the body depends on the included rows too, the cache hashes it for the ETag instead
+        return jsonify(body)
+    return with_version(jsonify(body), item.version)
+
+def patch_item(model, item_id, body):
+    """
+    Partial update of a Versioned row in one statement:
+    UPDATE ... SET <the columns of the body>, version = version + 1
+    WHERE id = ? [AND version IN (<If-Match>)] RETURNING <serialized columns>
+    The row is not read first. Only when nothing was updated, a SELECT tells a missing row (404)
+    from a version that does not match If-Match (412).
+    Returns (row, None), or (None, error response) with the same {"error"} bodies as PUT and DELETE.
+    """
+    if not isinstance(body, dict) or not body:
+        raise APIException("Body must be a JSON object with the fields to update")
+    for key in ('id', 'version'):
+        if key in body:
+            raise APIException("%s cannot be updated" % key)
+    error = validate_values(model, body)
+    if error:
+        raise APIException(error)
+
+    keys = tuple(field_spec(model))
+    stmt = update(model).where(model.id == item_id).values(body).values(version=model.version + 1)
+    versions = if_match_versions()
+    if versions is not None:
+        stmt = stmt.where(model.version.in_(versions))
+    stmt = stmt.execution_options(synchronize_session=False)
+
+    try:
+        if db.session.get_bind().dialect.update_returning:
+            row = db.session.execute(stmt.returning(*project(model, keys).selected_columns)).first()
+        else:
+            # MySQL has no UPDATE ... RETURNING, read the row back in the same transaction
+            updated = db.session.execute(stmt).rowcount
+            row = db.session.execute(project(model, keys).where(model.id == item_id)).first() if updated else None
+    except IntegrityError as e:
+        # e.g. the name of another row, a 409 and not a 500
+        db.session.rollback()
+        return None, (jsonify({"error": db_error(e)}), 409)
+
+    if row is None:
+        if db.session.execute(select(model.id).where(model.id == item_id)).first() is None:
+            return None, (jsonify({"error": "%s not found" % model.__name__}), 404)
+        return None, (jsonify({"error": "%s was modified, reload it and try again" % model.__name__}), 412)
+    return rows_to_dicts(keys, [row])[0], None
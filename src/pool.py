@@ -0,0 +1,90 @@
+import os
+import time
+import threading
+from sqlalchemy.pool import QueuePool
+
+# a checkout slower than this waited for a connection (or for a new one to be opened)
+WAIT_THRESHOLD = 0.001
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long checkouts wait for a free connection,
+    which is the first thing to look at when workers run out of connections.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                if elapsed > WAIT_THRESHOLD:
+                    self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+def engine_options(database_uri):
+    """
+    SQLAlchemy engine options taken from the environment:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE (seconds),
+    DB_POOL_PRE_PING (0/1) and DB_STATEMENT_TIMEOUT_MS (Postgres only, 0 disables it).
+    """
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') != '0',
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+    }
+    if database_uri.startswith('sqlite'):
+        # SQLite connections are local files, sizing a queue for them makes no sense
+        return options
+
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+    })
+    statement_timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and database_uri.startswith('postgresql'):
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % statement_timeout}
+    return options
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'checkouts': pool.checkouts,
+            'waits': pool.waits,
+            'wait_time_total_ms': round(pool.wait_time_total * 1000, 3),
+            'wait_time_max_ms': round(pool.wait_time_max * 1000, 3),
+        })
+    return stats
+
+def dispose_engines_after_fork(app, db):
+    # A forked worker (gunicorn --preload, multiprocessing...) must not reuse the parent's sockets.
+    # close=False drops the inherited connections without closing them under the parent's feet.
+    def dispose():
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+    os.register_at_fork(after_in_child=dispose)
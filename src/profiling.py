@@ -0,0 +1,153 @@
+import os
+import time
+import heapq
+import random
+import logging
+import cProfile
+import threading
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_STATEMENTS = 3
+
+class RouteMetrics:
+    """
+    Per-route latency histograms in the Prometheus text format.
+    Every gunicorn worker keeps its own numbers, scrape each of them or aggregate upstream.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, seconds, db_seconds, statements):
+        with self._lock:
+            metrics = self._routes.get((route, method))
+            if metrics is None:
+                metrics = self._routes[(route, method)] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0, 'db_sum': 0.0, 'statements': 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    metrics['buckets'][i] += 1
+            metrics['count'] += 1
+            metrics['sum'] += seconds
+            metrics['db_sum'] += db_seconds
+            metrics['statements'] += statements
+
+    def render(self):
+        lines = [
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        db_lines = ['# TYPE http_request_db_seconds_total counter']
+        statement_lines = ['# TYPE http_request_sql_statements_total counter']
+        with self._lock:
+            for (route, method), metrics in sorted(self._routes.items()):
+                labels = 'route="%s",method="%s"' % (route, method)
+                for bound, count in zip(self.buckets, metrics['buckets']):
+                    lines.append('http_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+                lines.append('http_request_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, metrics['count']))
+                lines.append('http_request_duration_seconds_sum{%s} %f' % (labels, metrics['sum']))
+                lines.append('http_request_duration_seconds_count{%s} %d' % (labels, metrics['count']))
+                db_lines.append('http_request_db_seconds_total{%s} %f' % (labels, metrics['db_sum']))
+                statement_lines.append('http_request_sql_statements_total{%s} %d' % (labels, metrics['statements']))
+        return '\n'.join(lines + db_lines + statement_lines) + '\n'
+
+
+route_metrics = RouteMetrics()
+
+def current_profile():
+    return g.get('profile') if has_app_context() else None
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # start times by cursor, a statement run while another one is executing has its own
+    conn.info.setdefault('query_start', {})[id(cursor)] = time.perf_counter()
+
+def handle_error(context):
+    # a failed statement never reaches after_cursor_execute, its start time must not stay behind
+    if context.connection is not None and context.execution_context is not None:
+        context.connection.info.get('query_start', {}).pop(id(context.execution_context.cursor), None)
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop(id(cursor))
+    profile = current_profile()
+    if profile is None:
+        return
+    profile['db_time'] += elapsed
+    profile['statements'] += 1
+    heapq.heappush(profile['slowest'], (elapsed, statement))
+    if len(profile['slowest']) > SLOWEST_STATEMENTS:
+        heapq.heappop(profile['slowest'])
+
+def setup_profiling(app):
+    """
+    Opt-in request profiling, enabled with PROFILING=1:
+    - Server-Timing header with app, db and total time plus the number of SQL statements
+    - statements slower than SLOW_QUERY_MS (default 100) are logged
+    - GET /metrics with per-route latency histograms
+    - PROFILE_SAMPLE_RATE (0 to 1) of the requests run under cProfile, and the ones slower
+      than PROFILE_THRESHOLD_MS (default 500) are dumped into PROFILE_DIR
+    """
+    if os.getenv('PROFILING', '0') == '0':
+        return
+
+    slow_query = float(os.getenv('SLOW_QUERY_MS', 100)) / 1000
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    profile_threshold = float(os.getenv('PROFILE_THRESHOLD_MS', 500)) / 1000
+    profile_dir = os.getenv('PROFILE_DIR', '/tmp/profiles')
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Engine, 'handle_error', handle_error)
+
+    @app.before_request
+    def start_profile():
+        g.profile = {'start': time.perf_counter(), 'db_time': 0.0, 'statements': 0, 'slowest': [], 'profiler': None}
+        if sample_rate and random.random() < sample_rate:
+            g.profile['profiler'] = cProfile.Profile()
+            g.profile['profiler'].enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        total = time.perf_counter() - profile['start']
+        db_time = profile['db_time']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        response.headers.add('Server-Timing', 'app;dur=%.2f' % ((total - db_time) * 1000))
+        response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d statements"' % (db_time * 1000, profile['statements']))
+        response.headers.add('Server-Timing', 'total;dur=%.2f' % (total * 1000))
+        route_metrics.observe(route, request.method, total, db_time, profile['statements'])
+
+        for elapsed, statement in sorted(profile['slowest'], reverse=True):
+            if elapsed >= slow_query:
+                logger.warning("Slow query (%.1f ms) in %s %s: %s", elapsed * 1000, request.method, route, statement)
+
+        profiler = profile['profiler']
+        if profiler is not None:
+            profiler.disable()
+            if total >= profile_threshold:
+                os.makedirs(profile_dir, exist_ok=True)
+                path = os.path.join(profile_dir, '%d-%s.prof' % (time.time() * 1000, request.endpoint))
+                profiler.dump_stats(path)
+                logger.warning("Profiled %s %s (%.1f ms) into %s", request.method, route, total * 1000, path)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(error=None):
+        # after_request is skipped on unhandled errors, do not leave the profiler running
+        profile = g.pop('profile', None)
+        if profile is not None and profile['profiler'] is not None:
+            profile['profiler'].disable()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return route_metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
@@ -0,0 +1,197 @@
+"""
+Optional read replicas, DATABASE_REPLICA_URLS=url1,url2 (empty: everything on DATABASE_URL).
+
+- GET, HEAD and OPTIONS requests read from a replica, picked round-robin per request. A replica
+  whose connection fails is skipped for REPLICA_RETRY_SECONDS (default 30), with every replica
+  down reads fall back to the primary.
+- Writes always go to the primary: INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE and flushes,
+  also when a GET handler writes, and the reads of that request after the write.
+- Read-your-writes: after a successful POST, PUT, PATCH or DELETE the client reads from the
+  primary for REPLICA_STICKY_SECONDS (default 5), so it sees its own write whatever the lag
+  of the replicas. The window is kept in a cookie, which every worker honors, and per worker
+  by Authorization header for authenticated clients that ignore cookies. Anonymous clients only
+  have the cookie, the clients behind one proxy share an address. Sticky clients skip the
+  response cache as well (see cache.py), and a response read from a replica is not
+  cached within REPLICA_STICKY_SECONDS of a write to its tables.
+
+To try it locally with SQLite, copy the database and point a replica at the copy; writes
+land in the primary only, so reads show the stickiness window come and go:
+
+    $ cp /tmp/test.db /tmp/replica.db
+    $ DATABASE_URL=sqlite:////tmp/test.db DATABASE_REPLICA_URLS=sqlite:////tmp/replica.db flask run
+"""
+import os
+import time
+import threading
+import itertools
+from collections import OrderedDict
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# the requests after which the client reads its own writes, not a CORS preflight
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+STICKY_COOKIE = 'read_primary_until'
+
+def is_write(clause):
+    if isinstance(clause, UpdateBase):
+        return True
+    if isinstance(clause, TextClause):
+        return not clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return getattr(clause, '_for_update_arg', None) is not None
+
+class ReplicaRouter:
+
+    def __init__(self, urls=(), sticky_seconds=5, retry_seconds=30, max_clients=10000):
+        self.urls = list(urls)
+        self.names = ['replica_%d' % index for index in range(len(self.urls))]
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.max_clients = max_clients
+        self._counter = itertools.count()
+        self._down_until = {}
+        # client -> time.time() until which it reads from the primary
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'sticky_reads': 0, 'failures': 0}
+
+    @property
+    def enabled(self):
+        return bool(self.names)
+
+    def binds(self, engine_options):
+        # SQLALCHEMY_BINDS entries, the replicas get the pool settings of the primary
+        return {name: dict(engine_options(url), url=url) for name, url in zip(self.names, self.urls)}
+
+    def init_app(self, app, db):
+        # after db.init_app(), which creates the engines of the binds
+        with app.app_context():
+            for name in self.names:
+                event.listen(db.engines[name], 'handle_error', self.on_error(name))
+        app.after_request(self.after_request)
+
+    def on_error(self, name):
+        def handle_error(context):
+            # connection refused, server gone, pre-ping failed...
+            if context.is_disconnect or context.connection is None or isinstance(context.sqlalchemy_exception, OperationalError):
+                self.mark_down(name)
+        return handle_error
+
+    def mark_down(self, name):
+        with self._lock:
+            self._down_until[name] = time.monotonic() + self.retry_seconds
+            self._stats['failures'] += 1
+
+    def pick(self):
+        # next healthy replica, None when they are all down
+        now = time.monotonic()
+        with self._lock:
+            for _ in self.names:
+                name = self.names[next(self._counter) % len(self.names)]
+                if self._down_until.get(name, 0) <= now:
+                    return name
+        return None
+
+    def client_key(self):
+        # None for anonymous clients, see the module docstring
+        return request.headers.get('Authorization') or None
+
+    def is_sticky(self, cookie, client_key):
+        now = time.time()
+        try:
+            if cookie and float(cookie) > now:
+                return True
+        except ValueError:
+            pass
+        if client_key is None:
+            return False
+        with self._lock:
+            return self._sticky.get(client_key, 0) > now
+
+    def is_sticky_request(self):
+        # the client of the current request wrote within REPLICA_STICKY_SECONDS
+        return self.enabled and self.is_sticky(request.cookies.get(STICKY_COOKIE), self.client_key())
+
+    def use_primary(self):
+        """
+        The next reads of the current request go to the primary, for a GET that writes what it
+        read. Returns True when the request was reading from a replica until then.
+        """
+        if not self.enabled or not has_request_context():
+            return False
+        replica = g.get('replica')
+        g.replica = None
+        return replica is not None
+
+    def stick(self, client_key):
+        until = time.time() + self.sticky_seconds
+        if client_key is None:
+            return until
+        with self._lock:
+            self._sticky[client_key] = until
+            self._sticky.move_to_end(client_key)
+            while len(self._sticky) > self.max_clients:
+                self._sticky.popitem(last=False)
+        return until
+
+    def after_request(self, response):
+        if request.method in WRITE_METHODS and response.status_code < 400 and self.sticky_seconds:
+            until = self.stick(self.client_key())
+            response.set_cookie(STICKY_COOKIE, '%.3f' % until, max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def read_bind(self, clause, flushing):
+        """
+        Name of the replica a statement of the current request reads from, None for the primary.
+        The choice is made once per request and kept in g.
+        """
+        if not self.enabled or not has_request_context() or request.method not in READ_METHODS:
+            return None
+        if flushing or is_write(clause):
+            # this request writes, it reads its own writes from the primary from now on
+            g.replica = None
+            return None
+        if 'replica' not in g:
+            if self.is_sticky_request():
+                g.replica = None
+                self.count('sticky_reads')
+            else:
+                g.replica = self.pick()
+                self.count('replica_reads' if g.replica else 'primary_reads')
+        return g.replica
+
+    def metrics(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = [{'name': name, 'up': self._down_until.get(name, 0) <= now} for name in self.names]
+        stats['enabled'] = self.enabled
+        return stats
+
+
+class RoutingSession(Session):
+    """
+    db.session: the statements of GET requests go to the replica picked by replica_router.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            name = replica_router.read_bind(clause, self._flushing)
+            if name is not None:
+                return self._db.engines[name]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+replica_router = ReplicaRouter(
+    urls=[url.strip().replace("postgres://", "postgresql://") for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+    sticky_seconds=int(os.getenv('REPLICA_STICKY_SECONDS', 5)),
+    retry_seconds=float(os.getenv('REPLICA_RETRY_SECONDS', 30)),
+)
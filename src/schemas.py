@@ -0,0 +1,143 @@
+"""
+Request bodies of the POST, PUT and PATCH endpoints, and the rows of the bulk endpoints and of
+the imports, decoded and validated against a schema compiled once per model from its columns:
+types, string lengths, enum values, required (non-nullable) fields and unknown fields. An invalid
+body is a 422 before any database work, an invalid row is reported in the errors of the result.
+
+With msgspec installed the schema is a Struct and the raw bytes are decoded and validated in a
+single pass; otherwise the body goes through the JSON provider and the same checks in Python.
+"""
+from functools import lru_cache
+from typing import Annotated, Literal, Optional, Union
+from flask import current_app, request
+from utils import APIException
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# set by the server, never by a request body
+SERVER_COLUMNS = ('version',)
+TYPE_NAMES = {int: 'int', str: 'str', float: 'float', bool: 'bool'}
+
+class Field:
+    def __init__(self, column, partial):
+        self.name = column.key
+        self.enums = getattr(column.type, 'enums', None)
+        self.python_type = str if self.enums else column.type.python_type
+        self.max_length = getattr(column.type, 'length', None) if self.python_type is str else None
+        self.nullable = bool(column.nullable or column.primary_key)
+        self.required = not partial and not self.nullable
+
+    def annotation(self, partial):
+        if self.enums:
+            annotation = Literal[tuple(self.enums)]
+        elif self.max_length:
+            annotation = Annotated[str, msgspec.Meta(max_length=self.max_length)]
+        else:
+            annotation = self.python_type
+        if self.nullable:
+            annotation = Optional[annotation]
+        if partial:
+            return Union[annotation, msgspec.UnsetType]
+        return annotation
+
+    def error(self, value):
+        # same messages as msgspec
+        where = " - at `$.%s`" % self.name
+        expected = TYPE_NAMES[self.python_type] + (' | null' if self.nullable else '')
+        if value is None:
+            return None if self.nullable else "Expected `%s`, got `null`%s" % (expected, where)
+        if type(value) is not self.python_type and not (self.python_type is float and type(value) is int):
+            got = TYPE_NAMES.get(type(value), 'object' if isinstance(value, dict) else 'array')
+            return "Expected `%s`, got `%s`%s" % (expected, got, where)
+        if self.enums and value not in self.enums:
+            return "Invalid enum value %r%s" % (value, where)
+        if self.max_length and len(value) > self.max_length:
+            return "Expected `str` of length <= %d%s" % (self.max_length, where)
+        return None
+
+class Schema:
+    """
+    Body schema of a model, partial=True for PATCH: every field optional, only the fields
+    of the body are returned. rows=True for the rows of /bulk and of the imports: partial,
+    and the version of exported rows is accepted.
+    """
+
+    def __init__(self, model, partial=False, rows=False):
+        self.partial = partial = partial or rows
+        self.fields = {column.key: Field(column, partial)
+                       for column in model.__table__.columns if rows or column.key not in SERVER_COLUMNS}
+        self.struct = self.decoder = None
+        if msgspec is not None:
+            fields = []
+            for field in self.fields.values():
+                if partial:
+                    fields.append((field.name, field.annotation(partial), msgspec.UNSET))
+                elif field.required:
+                    fields.append((field.name, field.annotation(partial)))
+                else:
+                    fields.append((field.name, field.annotation(partial), None))
+            self.struct = msgspec.defstruct('%sBody' % model.__name__, fields, kw_only=True, forbid_unknown_fields=True)
+            self.decoder = msgspec.json.Decoder(self.struct)
+
+    def decode(self, data):
+        """
+        Returns the body as a dict of column values, raises a 422 APIException when invalid.
+        """
+        if self.decoder is not None:
+            try:
+                return self.values(self.decoder.decode(data))
+            except msgspec.ValidationError as e:
+                raise APIException(str(e), status_code=422)
+            except msgspec.DecodeError as e:
+                raise APIException("Invalid JSON: %s" % e, status_code=422)
+        try:
+            body = current_app.json.loads(data)
+        except ValueError as e:
+            raise APIException("Invalid JSON: %s" % e, status_code=422)
+        return self.validate(body)
+
+    def convert(self, body):
+        """
+        decode() of a body that is already a Python object, e.g. one row of a bulk request.
+        """
+        if self.struct is not None:
+            try:
+                return self.values(msgspec.convert(body, self.struct))
+            except msgspec.ValidationError as e:
+                raise APIException(str(e), status_code=422)
+        return self.validate(body)
+
+    def values(self, struct):
+        body = msgspec.structs.asdict(struct)
+        if self.partial:
+            return {key: value for key, value in body.items() if value is not msgspec.UNSET}
+        return body
+
+    def validate(self, body):
+        # the checks of the msgspec Struct, without msgspec
+        if not isinstance(body, dict):
+            got = 'null' if body is None else TYPE_NAMES.get(type(body), 'array')
+            raise APIException("Expected `object`, got `%s`" % got, status_code=422)
+        for key, value in body.items():
+            field = self.fields.get(key)
+            if field is None:
+                raise APIException("Object contains unknown field `%s`" % key, status_code=422)
+            error = field.error(value)
+            if error:
+                raise APIException(error, status_code=422)
+        missing = [name for name, field in self.fields.items() if field.required and name not in body]
+        if missing:
+            raise APIException("Object missing required field `%s`" % missing[0], status_code=422)
+        if self.partial:
+            return body
+        return {name: body.get(name) for name in self.fields}
+
+@lru_cache(maxsize=None)
+def get_schema(model, partial=False, rows=False):
+    return Schema(model, partial, rows)
+
+def request_body(model, partial=False):
+    return get_schema(model, partial).decode(request.get_data())
@@ -0,0 +1,164 @@
+"""
+GET /search?q= over the search_fields of characters, planets and vehicles, ranked best match first.
+
+- SQLite: an FTS5 table, search_index, filled by triggers on the catalog tables, so every
+  write (endpoints, bulk upserts, admin) updates it in the same transaction. Prefix match
+  on every word of the query, ranked with bm25.
+- Postgres: pg_trgm GIN indexes on the searched text columns, ranked with similarity().
+- Other databases: prefix LIKE on the searched columns.
+Enum columns (vehicle manufacturer) are matched against their values in Python and
+queried with IN, which their btree index serves on every database.
+"""
+import re
+from sqlalchemy import event, func, or_, select, text
+from utils import APIException, int_arg
+from models import db, Character, Planet, Vehicle
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# bm25 weights of the name and extra columns of search_index, name matches weigh 10 times more
+SEARCH_RANK = 'bm25(10.0, 1.0)'
+# result type -> model, position + 1 is the tag of the type in the search_index rowid (id * 4 + tag)
+SEARCH_TYPES = (('character', Character), ('planet', Planet), ('vehicle', Vehicle))
+ROWID_STRIDE = 4
+
+def enum_values(column):
+    return getattr(column.type, 'enums', None)
+
+def text_fields(model):
+    return [field for field in model.search_fields if not enum_values(getattr(model, field))]
+
+def sqlite_statements(backfill=False):
+    """
+    DDL of the SQLite search index: the FTS5 table and the triggers of every catalog table,
+    plus (backfill=True) the statements indexing the rows already in the tables.
+    """
+    statements = ["CREATE VIRTUAL TABLE search_index USING fts5(name, extra, prefix='2 3')"]
+    for tag, (kind, model) in enumerate(SEARCH_TYPES, 1):
+        table = model.__tablename__
+        name, *extra = model.search_fields
+
+        def values(row):
+            extra_sql = " || ' ' || ".join("coalesce(%s.%s, '')" % (row, field) for field in extra) or "''"
+            return "%s.id * %d + %d, %s.%s, %s" % (row, ROWID_STRIDE, tag, row, name, extra_sql)
+
+        insert = "INSERT INTO search_index (rowid, name, extra) VALUES (%s);" % values('new')
+        delete = "DELETE FROM search_index WHERE rowid = old.id * %d + %d;" % (ROWID_STRIDE, tag)
+        statements += [
+            "CREATE TRIGGER search_%s_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert),
+            "CREATE TRIGGER search_%s_update AFTER UPDATE ON %s BEGIN %s %s END" % (table, table, delete, insert),
+            "CREATE TRIGGER search_%s_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete),
+        ]
+        if backfill:
+            statements.append("INSERT INTO search_index (rowid, name, extra) SELECT %s FROM %s" % (values(table), table))
+    return statements
+
+def postgresql_statements():
+    statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for kind, model in SEARCH_TYPES:
+        table = model.__tablename__
+        for field in text_fields(model):
+            statements.append('CREATE INDEX IF NOT EXISTS search_%s_%s_trgm ON "%s" USING gin (%s gin_trgm_ops)' % (table, field, table, field))
+    return statements
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    # db.create_all() builds the search index too, migrations do the same for existing databases
+    if connection.dialect.name == 'sqlite':
+        exists = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'search_index'").first()
+        if exists is None:
+            for statement in sqlite_statements(backfill=True):
+                connection.exec_driver_sql(statement)
+    elif connection.dialect.name == 'postgresql':
+        for statement in postgresql_statements():
+            connection.exec_driver_sql(statement)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    # the triggers and the Postgres indexes go away with their tables
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS search_index")
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def fts_search(words, kinds, limit):
+    # every word is a prefix ("sky" finds Skywalker). ORDER BY rank is the ordering FTS5 sorts
+    # itself, every match is ranked with SEARCH_RANK before the LIMIT
+    query = ' '.join('"%s"*' % word for word in words)
+    tags = {tag: kind for tag, (kind, _) in enumerate(SEARCH_TYPES, 1) if kind in kinds}
+    rows = db.session.execute(text(
+        "SELECT rowid, name, rank FROM search_index "
+        "WHERE search_index MATCH :query AND rank MATCH :rank AND rowid %% %d IN (%s) "
+        "ORDER BY rank LIMIT :limit"
+        % (ROWID_STRIDE, ','.join(str(tag) for tag in tags))
+    ), {'query': query, 'rank': SEARCH_RANK, 'limit': limit})
+    return [
+        {'type': tags[rowid % ROWID_STRIDE], 'id': rowid // ROWID_STRIDE, 'name': name, 'score': round(-rank, 4)}
+        for rowid, name, rank in rows
+    ]
+
+def match_conditions(model, q, pattern):
+    conditions = []
+    for field in model.search_fields:
+        column = getattr(model, field)
+        enums = enum_values(column)
+        if enums:
+            matches = [value for value in enums if q.lower() in value.lower()]
+            if matches:
+                conditions.append(column.in_(matches))
+        else:
+            conditions.append(column.ilike(pattern, escape='\\'))
+    return or_(*conditions)
+
+def trigram_search(q, kinds, limit):
+    results = []
+    for kind, model in SEARCH_TYPES:
+        if kind not in kinds:
+            continue
+        score = func.greatest(*[func.similarity(getattr(model, field), q) for field in text_fields(model)])
+        stmt = (select(model.id, model.name, score.label('score'))
+                .where(match_conditions(model, q, '%' + escape_like(q) + '%'))
+                .order_by(score.desc(), model.id)
+                .limit(limit))
+        results += [{'type': kind, 'id': id, 'name': name, 'score': round(score, 4)}
+                    for id, name, score in db.session.execute(stmt)]
+    return sorted(results, key=lambda result: -result['score'])[:limit]
+
+def prefix_search(q, kinds, limit):
+    results = []
+    for kind, model in SEARCH_TYPES:
+        if kind not in kinds:
+            continue
+        stmt = (select(model.id, model.name)
+                .where(match_conditions(model, q, escape_like(q) + '%'))
+                .order_by(func.length(model.name), model.id)
+                .limit(limit))
+        # shorter names are closer to the query
+        results += [{'type': kind, 'id': id, 'name': name, 'score': round(len(q) / max(len(name), 1), 4)}
+                    for id, name in db.session.execute(stmt)]
+    return sorted(results, key=lambda result: -result['score'])[:limit]
+
+def search(args):
+    q = args.get('q', '').strip()
+    words = re.findall(r'[^\W_]+', q.lower())
+    if not words:
+        raise APIException("q is required")
+    limit = int_arg(args, 'limit')
+    if limit is None:
+        limit = SEARCH_LIMIT
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise APIException("limit must be between 1 and %d" % MAX_SEARCH_LIMIT)
+    kinds = [kind for kind, _ in SEARCH_TYPES]
+    if args.get('type'):
+        kinds = args.get('type').split(',')
+        unknown = [kind for kind in kinds if kind not in dict(SEARCH_TYPES)]
+        if unknown:
+            raise APIException("Unknown type: %s" % ', '.join(unknown))
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return fts_search(words, kinds, limit)
+    if dialect == 'postgresql':
+        return trigram_search(q, kinds, limit)
+    return prefix_search(q, kinds, limit)
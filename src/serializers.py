@@ -0,0 +1,241 @@
+from functools import lru_cache
+from flask import request, jsonify, url_for
+from sqlalchemy import inspect, select, and_, or_, nulls_last
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import MANYTOONE
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from utils import APIException, STREAM_CHUNK_SIZE, arg_is_true, get_page_args, keyset_page, stream_json
+from models import db
+
+@lru_cache(maxsize=None)
+def field_spec(model):
+    # compiled once per model: json key -> column, from Model.serialize_fields
+    return {key: getattr(model, column) for key, column in model.serialize_fields}
+
+def requested_fields(model, args):
+    # ?fields=name,climate sparse fieldset, defaults to every serialized field
+    spec = field_spec(model)
+    fields = args.get('fields')
+    if not fields:
+        return tuple(spec)
+    keys = tuple(key.strip() for key in fields.split(',') if key.strip())
+    unknown = [key for key in keys if key not in spec]
+    if unknown:
+        raise APIException("Unknown fields: %s" % ', '.join(unknown))
+    return keys
+
+def project(model, keys):
+    # Column-only SELECT, rows come back as plain tuples without ORM hydration.
+    # The id always goes first because it is the pagination cursor.
+    spec = field_spec(model)
+    return select(model.id, *[spec[key] for key in keys])
+
+def coerce(column, value):
+    enums = getattr(column.type, 'enums', None)
+    if enums:
+        if value not in enums:
+            raise APIException("Invalid value for %s: %s" % (column.key, value))
+        return value
+    try:
+        return column.type.python_type(value)
+    except (TypeError, ValueError):
+        raise APIException("Invalid value for %s: %s" % (column.key, value))
+
+def apply_filters(stmt, model, args):
+    # ?climate=arid&climate=frozen -> WHERE climate IN ('arid', 'frozen'), only for whitelisted columns
+    for name in model.filter_fields:
+        values = args.getlist(name)
+        if not values:
+            continue
+        column = getattr(model, name)
+        values = [coerce(column, value) for value in values]
+        stmt = stmt.filter(column == values[0] if len(values) == 1 else column.in_(values))
+    return stmt
+
+def get_sort(model, args):
+    # ?sort=population or ?sort=-population for descending
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in model.sort_fields:
+        raise APIException("Cannot sort by %s, allowed: %s" % (name, ', '.join(model.sort_fields)))
+    return getattr(model, name), descending
+
+@compiles(UnaryExpression, 'mysql')
+def mysql_nulls_last(element, compiler, **kw):
+    # MySQL has no NULLS LAST, it sorts on "column IS NULL" first instead (without the index)
+    if element.modifier is not operators.nulls_last_op:
+        return compiler.visit_unary(element, **kw)
+    ordering = element.element
+    column = ordering.element if isinstance(ordering, UnaryExpression) else ordering
+    return '%s IS NULL, %s' % (compiler.process(column, **kw), compiler.process(ordering, **kw))
+
+def sorted_keyset_page(stmt, model, column, descending, limit, after, value):
+    # Keyset pagination on (column, id): the cursor is still the id of the last row seen
+    # and value is its sort value. NULLs always sort last, with NULLS LAST so that the
+    # index of the column still serves the ORDER BY.
+    nullable = column.nullable
+    if after is not None:
+        if value is None:
+            stmt = stmt.filter(column.is_(None), model.id > after)
+        else:
+            beyond = column < value if descending else column > value
+            condition = or_(beyond, and_(column == value, model.id > after))
+            stmt = stmt.filter(or_(condition, column.is_(None)) if nullable else condition)
+
+    ordering = column.desc() if descending else column
+    stmt = stmt.order_by(nulls_last(ordering) if nullable else ordering, model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def rows_to_dicts(keys, rows):
+    return [dict(zip(keys, row[1:])) for row in rows]
+
+# parent ids per IN list, a list without ?limit= is loaded in several batches
+INCLUDE_BATCH_SIZE = 1000
+
+def requested_includes(model, args):
+    include = args.get('include')
+    if not include:
+        return ()
+    names = tuple(dict.fromkeys(name.strip() for name in include.split(',') if name.strip()))
+    unknown = [name for name in names if name not in model.include_fields]
+    if unknown:
+        allowed = ', '.join(model.include_fields) or 'nothing'
+        raise APIException("Cannot include %s, allowed: %s" % (', '.join(unknown), allowed))
+    return names
+
+def related_model(model, name):
+    return inspect(model).relationships[name].mapper.class_
+
+def included_resources(model, args):
+    # tables the embedded rows come from, a write to any of them invalidates the cached response
+    return tuple(related_model(model, name).__tablename__ for name in requested_includes(model, args))
+
+def relationship_statement(model, name, ids):
+    # SELECT <parent id>, <serialized columns of the related rows> for the parents in ids
+    relationship = inspect(model).relationships[name]
+    target = relationship.mapper.class_
+    columns = list(field_spec(target).values())
+    (local, remote), = relationship.local_remote_pairs
+    if relationship.direction is MANYTOONE:
+        # character -> planet, joined on the primary key of the planet
+        return select(model.id, *columns).join(target, remote == local).where(model.id.in_(ids))
+    # planet -> residents, the foreign key of the related rows is the parent id
+    return select(remote, *columns).where(remote.in_(ids)).order_by(target.id)
+
+class Includes:
+    """
+    ?include=planet,vehicles of a catalog endpoint: the related rows are embedded in every
+    item, with one query per relationship for the whole page (WHERE <parent id> IN (<ids>)).
+    No I/O either: prepare() the items, execute the statements() and attach() their rows.
+    """
+
+    def __init__(self, model, args):
+        self.model = model
+        self.names = requested_includes(model, args)
+
+    def __bool__(self):
+        return bool(self.names)
+
+    def prepare(self, ids, items):
+        # items by id, with an empty value for every included relationship
+        relationships = inspect(self.model).relationships
+        for item in items:
+            for name in self.names:
+                item[name] = [] if relationships[name].uselist else None
+        return dict(zip(ids, items))
+
+    def statements(self, ids):
+        for start in range(0, len(ids), INCLUDE_BATCH_SIZE):
+            batch = ids[start:start + INCLUDE_BATCH_SIZE]
+            for name in self.names:
+                yield name, relationship_statement(self.model, name, batch)
+
+    def attach(self, items_by_id, name, rows):
+        keys = tuple(field_spec(related_model(self.model, name)))
+        for row, related in zip(rows, rows_to_dicts(keys, rows)):
+            item = items_by_id[row[0]]
+            if isinstance(item[name], list):
+                item[name].append(related)
+            else:
+                item[name] = related
+
+class ListQuery:
+    """
+    ?fields=, filters, ?sort=, ?limit= and ?after= of a list endpoint turned into a select().
+    It does no I/O itself so the WSGI and the ASGI apps can run it with their own session:
+    when sorting on another column than the id, the sort value of the cursor row has to be
+    read first with cursor_statement() and handed to statement().
+    """
+
+    def __init__(self, model, args, *conditions):
+        self.model = model
+        self.args = args
+        # conditions of the endpoint itself, e.g. the planet of /planets/<id>/residents
+        self.conditions = conditions
+        self.keys = requested_fields(model, args)
+        self.limit, self.after = get_page_args(args)
+        self.column, self.descending = get_sort(model, args)
+        self.includes = Includes(model, args)
+
+    @property
+    def needs_cursor_value(self):
+        return self.after is not None and self.column is not self.model.id
+
+    def cursor_statement(self):
+        return select(self.column).where(self.model.id == self.after)
+
+    def statement(self, cursor_row=None):
+        model = self.model
+        stmt = apply_filters(project(model, self.keys), model, self.args).where(*self.conditions)
+        if self.column is model.id and not self.descending:
+            return keyset_page(stmt, model, self.limit, self.after)
+        if self.needs_cursor_value:
+            if cursor_row is None:
+                raise APIException("Unknown cursor: %s" % self.after)
+            value = cursor_row[0]
+        else:
+            value = self.after
+        return sorted_keyset_page(stmt, model, self.column, self.descending, self.limit, self.after, value)
+
+    def next_cursor(self, rows):
+        if self.limit is not None and len(rows) == self.limit:
+            return rows[-1][0]
+        return None
+
+    def to_dicts(self, rows):
+        return rows_to_dicts(self.keys, rows)
+
+def include_related(includes, ids, items):
+    if includes:
+        items_by_id = includes.prepare(ids, items)
+        for name, stmt in includes.statements(ids):
+            includes.attach(items_by_id, name, db.session.execute(stmt).all())
+    return items
+
+def list_response(model, *conditions):
+    query = ListQuery(model, request.args, *conditions)
+    cursor_row = None
+    if query.needs_cursor_value:
+        cursor_row = db.session.execute(query.cursor_statement()).first()
+    stmt = query.statement(cursor_row)
+
+    if arg_is_true('stream'):
+        def chunks():
+            result = db.session.execute(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+            for partition in result.partitions():
+                yield include_related(query.includes, [row[0] for row in partition], query.to_dicts(partition))
+        return stream_json(chunks())
+
+    rows = db.session.execute(stmt).all()
+    response = jsonify(include_related(query.includes, [row[0] for row in rows], query.to_dicts(rows)))
+    next_cursor = query.next_cursor(rows)
+    if next_cursor is not None:
+        args = request.args.to_dict(flat=False)
+        args['after'] = next_cursor
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = '<%s>; rel="next"' % url_for(request.endpoint, **request.view_args, **args)
+    return response, 200
@@ -0,0 +1,10 @@
+from flask import jsonify
+from flask_swagger import swagger
+
+def setup_swagger(app):
+    # Swagger 2.0 spec built from the docstrings of the endpoints, enabled with ENABLE_SWAGGER=1
+    @app.route('/swagger.json', methods=['GET'])
+    def swagger_spec():
+        spec = swagger(app)
+        spec['info']['title'] = "Star Wars API"
+        return jsonify(spec), 200
@@ -0,0 +1,363 @@
+"""
+Export and import of whole tables, as NDJSON (one row per line) or, with pyarrow installed,
+as Parquet files (CLI) and Arrow IPC streams (endpoints).
+
+    $ flask db export                                   # every table into ./<table>.ndjson
+    $ flask db export character planet --format parquet --output-dir backups
+    $ flask db import backups/character.parquet backups/planet.parquet
+
+    GET  /export/<table>[?format=arrow]
+    POST /import/<table>   (NDJSON, JSON array or Arrow stream body)
+
+The endpoints need the token of a user with is_admin (see auth.py), the CLI does not.
+
+Rows are read with a server-side cursor (yield_per) so memory stays flat whatever the size of
+the table. On Postgres the CLI export runs a COPY ... TO STDOUT and imports load every chunk
+with COPY FROM STDIN into a temporary table merged with INSERT ... ON CONFLICT. Imports are
+upserts on the id, like the /bulk endpoints, and report their throughput in rows/s.
+"""
+import io
+import os
+import time
+import logging
+import click
+from flask import Response, current_app, request, stream_with_context
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException
+from bulk import bulk_upsert, validate_row, iter_request_rows
+from cache import response_cache
+from models import db, Character, Planet, Vehicle, Favorites, FavoritesDocument
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 5000
+COPY_CHUNK_SIZE = 10000
+# in foreign key order, the order tables are exported and imported in
+TABLES = {model.__tablename__: model for model in (Planet, Character, Vehicle, Favorites)}
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+def get_model(table):
+    model = TABLES.get(table)
+    if model is None:
+        raise APIException("Unknown table: %s, allowed: %s" % (table, ', '.join(TABLES)), status_code=404)
+    return model
+
+def require_pyarrow():
+    # imported on first use, pyarrow alone takes longer to import than the rest of the app
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise APIException("Parquet and Arrow need pyarrow, install it with `pipenv install pyarrow`")
+    return pyarrow
+
+def rate(rows, seconds):
+    return round(rows / seconds) if seconds else rows
+
+def can_copy():
+    # COPY goes through psycopg2's cursor.copy_expert()
+    bind = db.session.get_bind()
+    return bind.dialect.name == 'postgresql' and bind.dialect.driver == 'psycopg2'
+
+# Export
+
+def export_chunks(model, chunk_size=EXPORT_CHUNK_SIZE):
+    # lists of row dicts keyed by column name, read through a server-side cursor
+    table = model.__table__
+    result = db.session.execute(select(table).order_by(table.c.id).execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield [dict(row._mapping) for row in partition]
+
+def ndjson_lines(chunks, dumps):
+    for chunk in chunks:
+        yield b''.join(dumps(row) + b'\n' for row in chunk)
+
+ARROW_TYPES = {int: 'int64', str: 'string', bool: 'bool_', float: 'float64'}
+
+def arrow_schema(model):
+    pyarrow = require_pyarrow()
+    fields = []
+    for column in model.__table__.columns:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        fields.append((column.name, getattr(pyarrow, ARROW_TYPES.get(python_type, 'string'))()))
+    return pyarrow.schema(fields)
+
+class ChunkSink(io.RawIOBase):
+    # write-only file that hands over what was written since the last drain()
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def arrow_stream(model, chunks):
+    # Arrow IPC stream, one record batch per chunk, flushed to the client as it is written
+    pyarrow = require_pyarrow()
+    schema = arrow_schema(model)
+    sink = ChunkSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    for chunk in chunks:
+        writer.write_table(pyarrow.Table.from_pylist(chunk, schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def postgres_copy_export(model, path):
+    # COPY of row_to_json(); the csv quote and delimiter are characters JSON never contains,
+    # so the lines come out unescaped
+    cursor = db.session.connection().connection.cursor()
+    with open(path, 'wb') as output:
+        cursor.copy_expert(
+            "COPY (SELECT row_to_json(t) FROM \"%s\" t ORDER BY id) TO STDOUT "
+            "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')" % model.__tablename__,
+            output,
+        )
+    return cursor.rowcount
+
+def export_file(model, path, file_format, dumps):
+    """
+    Writes a table into path, returns (rows, seconds).
+    """
+    start = time.perf_counter()
+    rows = 0
+    if file_format == 'parquet':
+        pyarrow = require_pyarrow()
+        schema = arrow_schema(model)
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for chunk in export_chunks(model):
+                writer.write_table(pyarrow.Table.from_pylist(chunk, schema))
+                rows += len(chunk)
+    elif can_copy():
+        rows = postgres_copy_export(model, path)
+    else:
+        with open(path, 'wb') as output:
+            for chunk in export_chunks(model):
+                output.write(b''.join(dumps(row) + b'\n' for row in chunk))
+                rows += len(chunk)
+    return rows, time.perf_counter() - start
+
+# Import
+
+def copy_value(value):
+    # COPY text format
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+class LineReader(io.RawIOBase):
+    # readable file over an iterator of text lines, for cursor.copy_expert()
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line.encode()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def postgres_copy_rows(model, columns, rows):
+    # COPY into a temporary table, then one INSERT ... ON CONFLICT merges it into the table
+    table = model.__tablename__
+    quoted = ', '.join('"%s"' % column for column in columns)
+    updates = ['"%s" = EXCLUDED."%s"' % (column, column) for column in columns if column not in ('id', 'version')]
+    if 'version' in model.__table__.c and updates:
+        updates.append('version = "%s".version + 1' % table)
+    conflict = 'DO UPDATE SET %s' % ', '.join(updates) if updates else 'DO NOTHING'
+
+    with db.session.connection().connection.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE import_%s (LIKE "%s" INCLUDING DEFAULTS) ON COMMIT DROP' % (table, table))
+        lines = ('\t'.join(copy_value(row.get(column)) for column in columns) + '\n' for row in rows)
+        cursor.copy_expert('COPY import_%s (%s) FROM STDIN' % (table, quoted), LineReader(lines))
+        cursor.execute('INSERT INTO "%s" (%s) SELECT %s FROM import_%s ON CONFLICT (id) %s' % (table, quoted, quoted, table, conflict))
+
+def postgres_copy_import(model, rows):
+    """
+    Same result as bulk_upsert(): chunks of rows with the same keys go through COPY, a chunk
+    the database rejects is replayed through bulk_upsert() to find the failing rows.
+    """
+    saved = 0
+    errors = []
+    chunk = []
+    # the raw cursor raises the errors of the driver (psycopg2.Error), not SQLAlchemy's
+    dbapi_error = db.session.get_bind().dialect.loaded_dbapi.Error
+
+    def flush(chunk):
+        groups = {}
+        for index, row in chunk:
+            groups.setdefault(tuple(sorted(row)), []).append((index, row))
+        done = 0
+        for columns, group in groups.items():
+            try:
+                postgres_copy_rows(model, columns, [row for _, row in group])
+                db.session.commit()
+                done += len(group)
+            except (SQLAlchemyError, dbapi_error):
+                db.session.rollback()
+                result = bulk_upsert(model, ((row, None) for _, row in group))
+                done += result['saved']
+                errors.extend({"index": group[error['index']][0], "error": error['error']} for error in result['errors'])
+        return done
+
+    for index, (row, error) in enumerate(rows):
+        error = error or validate_row(model, row)
+        if error:
+            errors.append({"index": index, "error": error})
+            continue
+        chunk.append((index, row))
+        if len(chunk) == COPY_CHUNK_SIZE:
+            saved += flush(chunk)
+            chunk = []
+    if chunk:
+        saved += flush(chunk)
+    errors.sort(key=lambda e: e["index"])
+    return {"saved": saved, "errors": errors}
+
+def after_import(model):
+    # the same invalidations as the /bulk endpoints, plus the id sequence on Postgres
+    if model is Favorites:
+        FavoritesDocument.query.delete()
+    else:
+        FavoritesDocument.invalidate('%s_id' % model.__tablename__)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        table = model.__tablename__
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), coalesce(max(id), 1)) FROM \"%s\"" % (table, table)))
+    db.session.commit()
+    response_cache.bump(model.__tablename__)
+
+def import_rows(model, rows):
+    """
+    Upserts (row, error) tuples into the table of model, returns the bulk_upsert() result
+    with the time it took and the throughput.
+    """
+    start = time.perf_counter()
+    if can_copy():
+        result = postgres_copy_import(model, rows)
+    else:
+        result = bulk_upsert(model, rows)
+    after_import(model)
+    seconds = time.perf_counter() - start
+    result['seconds'] = round(seconds, 3)
+    result['rows_per_second'] = rate(result['saved'], seconds)
+    return result
+
+def ndjson_rows(lines, loads):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield loads(line), None
+        except ValueError as e:
+            yield None, "Invalid JSON: %s" % e
+
+def arrow_rows(batches):
+    for batch in batches:
+        for row in batch.to_pylist():
+            yield row, None
+
+def file_rows(path):
+    if path.endswith('.parquet'):
+        pyarrow = require_pyarrow()
+        yield from arrow_rows(pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=EXPORT_CHUNK_SIZE))
+        return
+    with open(path, 'rb') as lines:
+        yield from ndjson_rows(lines, current_app.json.loads)
+
+# Endpoints
+
+def logged_chunks(model, chunks):
+    start = time.perf_counter()
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        yield chunk
+    seconds = time.perf_counter() - start
+    logger.info("Exported %d rows of %s in %.2fs (%d rows/s)", rows, model.__tablename__, seconds, rate(rows, seconds))
+
+def export_response(model):
+    chunks = logged_chunks(model, export_chunks(model))
+    if request.args.get('format') == 'arrow':
+        require_pyarrow()
+        return Response(stream_with_context(arrow_stream(model, chunks)), mimetype=ARROW_MIMETYPE)
+    return Response(stream_with_context(ndjson_lines(chunks, current_app.json.dumps_bytes)), mimetype='application/x-ndjson')
+
+def import_request_rows():
+    if request.mimetype == ARROW_MIMETYPE:
+        pyarrow = require_pyarrow()
+        return arrow_rows(pyarrow.ipc.open_stream(request.stream))
+    return iter_request_rows()
+
+# CLI, added to the `flask db` group of Flask-Migrate
+
+@click.command('export')
+@click.argument('tables', nargs=-1)
+@click.option('--format', 'file_format', type=click.Choice(['ndjson', 'parquet']), default='ndjson')
+@click.option('--output-dir', default='.', type=click.Path(file_okay=False))
+@with_appcontext
+def export_command(tables, file_format, output_dir):
+    """Export tables (all of them by default) into OUTPUT_DIR/<table>.<format>."""
+    unknown = [table for table in tables if table not in TABLES]
+    if unknown:
+        raise click.BadParameter("unknown tables %s, allowed: %s" % (', '.join(unknown), ', '.join(TABLES)))
+    os.makedirs(output_dir, exist_ok=True)
+    for table in tables or TABLES:
+        path = os.path.join(output_dir, '%s.%s' % (table, file_format))
+        try:
+            rows, seconds = export_file(TABLES[table], path, file_format, current_app.json.dumps_bytes)
+        except APIException as e:
+            raise click.ClickException(e.message)
+        click.echo("%s: %d rows in %.2fs (%d rows/s) -> %s" % (table, rows, seconds, rate(rows, seconds), path))
+
+@click.command('import')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--table', help="Table of the files, by default the file name: planet.ndjson, planet.parquet")
+@with_appcontext
+def import_command(paths, table):
+    """Import NDJSON or Parquet files, rows are upserted on their id."""
+    files = [(table or os.path.basename(path).split('.')[0], path) for path in paths]
+    unknown = [name for name, _ in files if name not in TABLES]
+    if unknown:
+        raise click.BadParameter("unknown tables %s, allowed: %s" % (', '.join(unknown), ', '.join(TABLES)))
+    # referenced tables first
+    order = list(TABLES)
+    for name, path in sorted(files, key=lambda item: order.index(item[0])):
+        try:
+            result = import_rows(TABLES[name], file_rows(path))
+        except APIException as e:
+            raise click.ClickException(e.message)
+        click.echo("%s: %d rows in %.2fs (%d rows/s) <- %s, %d errors" % (
+            name, result['saved'], result['seconds'], result['rows_per_second'], path, len(result['errors'])))
+        for error in result['errors'][:10]:
+            click.echo("  row %d: %s" % (error['index'], error['error']))
+
+def register_commands():
+    from flask_migrate.cli import db as db_group
+    db_group.add_command(export_command)
+    db_group.add_command(import_command)
@@ -1,4 +1,8 @@
-from flask import jsonify, url_for
+import hashlib
+from flask import current_app, request, Response, stream_with_context
+
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
 
 class APIException(Exception):
     status_code = 400
@@ -15,18 +19,65 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def arg_is_true(name, args=None):
+    args = request.args if args is None else args
+    return args.get(name, '').lower() in ('1', 'true', 'yes')
+
+def int_arg(args, name):
+    # a value that is not an integer is an error, not a missing parameter (the whole table)
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise APIException("%s must be an integer" % name)
+
+def get_page_args(args=None):
+    args = request.args if args is None else args
+    limit = int_arg(args, 'limit')
+    after = int_arg(args, 'after')
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise APIException("limit must be between 1 and %d" % MAX_PAGE_SIZE)
+    return limit, after
+
+def keyset_page(query, model, limit=None, after=None):
+    # Keyset (seek) pagination on the primary key: the cursor is the last id
+    # the client has seen, so every page is an index range scan instead of an OFFSET
+    if after is not None:
+        query = query.filter(model.id > after)
+    query = query.order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def stream_json(chunks):
+    # Writes the JSON array chunk by chunk (each chunk a list of dicts),
+    # so memory per request stays constant whatever the size of the table
+    def generate():
+        yield '['
+        separator = ''
+        for chunk in chunks:
+            if chunk:
+                yield separator + ','.join(current_app.json.dumps(item) for item in chunk)
+                separator = ','
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if 'admin' in app.blueprints else []
+    # built from the url map, no request context needed so it can run at start-up
+    urls = app.url_map.bind('localhost')
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
         if "GET" in rule.methods and has_no_empty_params(rule):
-            url = url_for(rule.endpoint, **(rule.defaults or {}))
+            url = urls.build(rule.endpoint, rule.defaults or {})
             if "/admin/" not in url:
                 links.append(url)
 
@@ -39,3 +90,35 @@ def generate_sitemap(app):
         <p>Start working on your proyect by following the <a href="https://start.4geeksacademy.com/starters/flask" target="_blank">Quick Start</a></p>
         <p>Remember to specify a real endpoint path like: </p>
         <ul style="text-align: left;">"""+links_html+"</ul></div>"
+
+def sitemap_routes(app):
+    # every route of the API with its methods and path parameters, for the JSON sitemap
+    routes = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: (rule.rule, rule.endpoint)):
+        if rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        routes.append({
+            'rule': rule.rule,
+            'endpoint': rule.endpoint,
+            'methods': sorted(rule.methods - {'HEAD', 'OPTIONS'}),
+            'arguments': sorted(rule.arguments),
+        })
+    return routes
+
+def sitemap_entry(body, content_type):
+    return {'body': body, 'etag': hashlib.sha1(body).hexdigest(), 'headers': [('Content-Type', content_type)]}
+
+def build_sitemap(app):
+    """
+    Renders the HTML and JSON sitemaps once and keeps them in app.extensions['sitemap'].
+    Called at the end of create_app(): Flask refuses new routes once it served a request,
+    so the url map cannot change afterwards.
+    """
+    app.extensions['sitemap'] = {
+        'text/html': sitemap_entry(generate_sitemap(app).encode(), 'text/html; charset=utf-8'),
+        'application/json': sitemap_entry(app.json.dumps_bytes(sitemap_routes(app)), 'application/json'),
+    }
+    return app.extensions['sitemap']
+
+def get_sitemap(app, mimetype):
+    return app.extensions['sitemap'][mimetype]
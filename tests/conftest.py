@@ -0,0 +1,105 @@
+import os
+import sys
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# read when the modules are imported, before any test runs
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ['ENABLE_ADMIN'] = '0'
+os.environ['FLASK_APP_KEY'] = 'test key'
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # the app on a fresh SQLite file per test, created with create_all()
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///%s' % (tmp_path / 'test.db'))
+    from app import create_app
+    from auth import user_status_cache
+    from cache import response_cache
+    from models import db
+    response_cache.clear()
+    user_status_cache.clear()
+    app = create_app(migrations=False)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def statements(app):
+    # SQL statements run on the primary engine while the test runs
+    from models import db
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+def auth_headers(user_id):
+    # Authorization header of a token of the user, without going through /login (which
+    # caches the status of the user as well)
+    from auth import issue_token, user_status
+    from models import db, User
+    user_status(user_id)
+    return {'Authorization': 'Bearer %s' % issue_token(db.session.get(User, user_id))}
+
+def seed_catalog():
+    # 1 user, 5 planets, 10 characters and 5 vehicles
+    from models import db, User, Character, Planet, Vehicle
+    db.session.add(User(id=1, email='luke@example.com', username='luke', password='secret', is_active=True))
+    for i in range(1, 6):
+        db.session.add(Planet(id=i, name='Planet %d' % i, climate='arid', terrain='desert', population=i * 1000))
+    db.session.flush()
+    for i in range(1, 11):
+        db.session.add(Character(id=i, name='Character %d' % i, gender='male', eye_color='blue',
+                                 hair_color='brown', height=150 + i, planet_id=i % 5 + 1))
+    db.session.flush()
+    for i in range(1, 6):
+        db.session.add(Vehicle(id=i, name='Vehicle %d' % i, model='T-%d' % i, manufacturer='Incom Corporation', character_id=i))
+    db.session.commit()
+
+def add_favorites(count):
+    # count favorites of user 1, spread over characters, planets and vehicles
+    from models import db, Favorites
+    targets = [('character_id', i) for i in range(1, 11)] + [('planet_id', i) for i in range(1, 6)] + [('vehicle_id', i) for i in range(1, 6)]
+    for column, target_id in targets[:count]:
+        db.session.add(Favorites(user_id=1, **{column: target_id}))
+    db.session.commit()
+    db.session.expunge_all()
+
+@pytest.fixture
+def catalog(app):
+    seed_catalog()
+    return app
+
+@pytest.fixture
+def admin(catalog):
+    # id of an admin user, for /export, /import and the bulk endpoints
+    from models import db, User
+    db.session.add(User(id=2, email='leia@example.com', username='leia', password='secret', is_active=True, is_admin=True))
+    db.session.commit()
+    return 2
+
+@pytest.fixture(scope='session')
+def asgi(tmp_path_factory):
+    # asgi.py builds its app when it is imported, on its own SQLite file seeded like catalog
+    pytest.importorskip('asgiref')
+    pytest.importorskip('aiosqlite')
+    database_url = 'sqlite:///%s' % (tmp_path_factory.mktemp('asgi') / 'test.db')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv('DATABASE_URL', database_url)
+        import asgi
+    from models import db
+    with asgi.app.app_context():
+        db.create_all()
+        seed_catalog()
+    return asgi
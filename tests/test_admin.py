@@ -0,0 +1,76 @@
+import re
+import base64
+import pytest
+from conftest import auth_headers
+from models import db, User, Character
+
+def basic(email, password):
+    return {'Authorization': 'Basic %s' % base64.b64encode(('%s:%s' % (email, password)).encode()).decode()}
+
+@pytest.fixture
+def site(admin, catalog):
+    # conftest boots the app with ENABLE_ADMIN=0
+    from admin import setup_admin
+    setup_admin(catalog)
+    return catalog
+
+def catalog_view(site, model):
+    return next(view for view in site.extensions['admin'][0]._views if getattr(view, 'model', None) is model)
+
+@pytest.mark.parametrize('headers', [
+    dict, lambda: basic('luke@example.com', 'secret'), lambda: basic('leia@example.com', 'wrong'), lambda: auth_headers(1),
+], ids=['anonymous', 'user', 'wrong password', 'user token'])
+def test_only_admins_get_in(site, headers):
+    response = site.test_client().get('/admin/user/', headers=headers())
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Basic realm="admin"'
+
+def test_admins_get_in_with_a_password_or_a_token(site, admin):
+    client = site.test_client()
+    response = client.get('/admin/user/', headers=basic('leia@example.com', 'secret'))
+    assert response.status_code == 200
+    assert b'leia@example.com' in response.data
+    assert b'secret' not in response.data
+    assert client.get('/admin/character/', headers=auth_headers(admin)).status_code == 200
+
+def test_user_forms_cannot_make_admins(site):
+    view = catalog_view(site, User)
+    form = view.get_create_form()
+    assert not hasattr(form, 'is_admin') and not hasattr(form, 'token_version')
+    user = User(email='han@example.com', username='han', password='falcon', is_active=True)
+    view.on_model_change(None, user, True)
+    assert user.password.startswith(('scrypt:', 'pbkdf2:'))
+
+def test_list_pages_follow_the_next_links(site, admin):
+    client = site.test_client()
+    headers = auth_headers(admin)
+    url, pages = '/admin/character/?page_size=3', []
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        pages.append([int(name) for name in re.findall(r'>\s*Character (\d+)\s*<', html)])
+        if len(pages) > 1:
+            assert 'href="/admin/character/?page_size=3"' in html
+        links = re.findall(r'href="([^"]*after=\d+)"', html)
+        url = links[0].replace('&amp;', '&') if links else None
+    assert pages == [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]]
+
+def test_sorted_pages_keep_ties_and_nulls(site, statements):
+    for character_id, height in ((3, None), (7, None), (5, 154)):
+        db.session.get(Character, character_id).height = height
+    db.session.commit()
+    view = catalog_view(site, Character)
+    ids, after = [], None
+    del statements[:]
+    while True:
+        with site.test_request_context('/admin/character/' + ('?after=%d' % after if after else '')):
+            count, page = view.get_list(0, 'height', True, None, None, page_size=3)
+        assert count == 10
+        ids += [character.id for character in page]
+        if len(page) < 3:
+            break
+        after = page[-1].id
+    # height descending, ties on id, NULLs last, and no COUNT(*) of the table
+    assert ids == [10, 9, 8, 6, 4, 5, 2, 1, 3, 7]
+    assert not any('count(' in statement.lower() for statement in statements)
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from werkzeug.datastructures import Headers
+from conftest import auth_headers
+from cache import response_cache
+from models import db, Favorites
+
+ORIGIN = 'http://example.com'
+
+def asgi_get(asgi, path, query_string=b'', headers=()):
+    # (status, headers, body) of a GET through asgi.application
+    messages = []
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string, 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+        'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000), 'http_version': '1.1',
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def call():
+        await asgi.application(scope, receive, send)
+        # the pooled connections belong to this event loop
+        await asgi.engine.dispose()
+
+    asyncio.run(call())
+    start, body = messages
+    return start['status'], Headers([(name.decode(), value.decode()) for name, value in start['headers']]), body['body']
+
+@pytest.fixture
+def get(asgi):
+    response_cache.clear()
+    return lambda path, *args, **kwargs: asgi_get(asgi, path, *args, **kwargs)
+
+@pytest.fixture
+def authorization(asgi):
+    # the Authorization header of user 1, whose favorites the tests read
+    with asgi.app.app_context():
+        return list(auth_headers(1).items())
+
+@pytest.mark.parametrize('path', ['/characters', '/characters/1', '/characters/999', '/users/1/favorites'])
+def test_async_routes_send_cors_headers(get, authorization, path):
+    for _ in range(2):
+        # the second request of the catalog routes is a cache hit
+        status, headers, _ = get(path, headers=[('Origin', ORIGIN)] + authorization)
+        assert status in (200, 404)
+        assert headers['Access-Control-Allow-Origin'] == ORIGIN
+
+def test_async_error_sends_cors_headers(get):
+    status, headers, _ = get('/characters', b'limit=abc', headers=[('Origin', ORIGIN)])
+    assert status == 400
+    assert headers['Access-Control-Allow-Origin'] == ORIGIN
+
+def test_async_favorites_are_compressed(asgi, get, authorization):
+    with asgi.app.app_context():
+        Favorites.query.filter_by(user_id=1).delete()
+        db.session.add_all([Favorites(user_id=1, character_id=i) for i in range(1, 11)])
+        db.session.commit()
+    status, headers, body = get('/users/1/favorites', headers=[('Accept-Encoding', 'gzip')] + authorization)
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in headers['Vary']
+
+def test_async_favorites_need_the_token_of_the_user(get, authorization):
+    assert get('/users/1/favorites')[0] == 401
+    assert get('/users/2/favorites', headers=authorization)[0] == 403
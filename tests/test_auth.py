@@ -0,0 +1,31 @@
+import pytest
+from conftest import auth_headers
+
+@pytest.mark.parametrize('body', [
+    {'email': 'luke@example.com', 'password': 123},
+    {'email': ['luke@example.com'], 'password': 'secret'},
+])
+def test_login_rejects_values_that_are_not_strings(catalog, body):
+    response = catalog.test_client().post('/login', json=body)
+    assert response.status_code == 400
+
+def test_login_rehashes_a_plaintext_password(catalog):
+    client = catalog.test_client()
+    response = client.post('/login', json={'email': 'luke@example.com', 'password': 'secret'})
+    assert response.status_code == 200
+    headers = {'Authorization': 'Bearer %s' % response.json['token']}
+    assert client.get('/users/1/favorites', headers=headers).status_code == 200
+
+@pytest.mark.parametrize('path', ['/users/1/favorites', '/users/1/favorites/summary'])
+def test_favorites_are_only_read_by_their_user(catalog, path):
+    client = catalog.test_client()
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=auth_headers(1)).status_code == 200
+    assert client.get(path.replace('/1/', '/2/'), headers=auth_headers(1)).status_code == 403
+
+def test_no_token_without_a_signing_key(catalog):
+    client = catalog.test_client()
+    headers = auth_headers(1)
+    catalog.secret_key = None
+    assert client.post('/login', json={'email': 'luke@example.com', 'password': 'secret'}).status_code == 503
+    assert client.get('/users/1/favorites', headers=headers).status_code == 503
@@ -0,0 +1,40 @@
+import pytest
+import schemas
+from conftest import auth_headers
+from models import db, Character
+
+ROWS = [
+    {'id': 11, 'name': 'Character 11', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown', 'height': 180},
+    {'id': 12, 'name': 'Character 12', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown', 'height': 'tall'},
+    {'id': 13, 'name': 'x' * 151, 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown'},
+    {'id': 14, 'name': 'Character 14', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown', 'side': 'dark'},
+    # an exported row has a version
+    {'id': 1, 'name': 'Character 1', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown', 'height': 190, 'version': 1},
+]
+
+@pytest.fixture(params=['msgspec', 'python'])
+def schema_backend(request, monkeypatch):
+    if request.param == 'msgspec':
+        pytest.importorskip('msgspec')
+    else:
+        monkeypatch.setattr(schemas, 'msgspec', None)
+    schemas.get_schema.cache_clear()
+    yield request.param
+    schemas.get_schema.cache_clear()
+
+def test_bulk_rows_are_validated_like_request_bodies(catalog, admin, schema_backend):
+    response = catalog.test_client().post('/characters/bulk', json=ROWS, headers=auth_headers(admin))
+    assert response.status_code == 200
+    assert response.json['saved'] == 2
+    errors = {error['index']: error['error'] for error in response.json['errors']}
+    assert sorted(errors) == [1, 2, 3]
+    assert errors[1] == "Expected `int | null`, got `str` - at `$.height`"
+    assert db.session.get(Character, 12) is None
+    assert db.session.get(Character, 11).height == 180
+    assert db.session.get(Character, 1).height == 190
+
+def test_bulk_needs_an_admin(catalog):
+    client = catalog.test_client()
+    assert client.post('/characters/bulk', json=ROWS).status_code == 401
+    assert client.post('/planets/bulk', json=[], headers=auth_headers(1)).status_code == 403
+    assert client.post('/vehicles/bulk', json=[], headers=auth_headers(1)).status_code == 403
@@ -0,0 +1,53 @@
+from conftest import auth_headers
+from models import db, Character
+
+CHARACTER = {
+    'id': 1, 'name': 'Luke', 'birth_year': '19BBY', 'gender': 'male', 'height': 172, 'weight': 77,
+    'eye_color': 'blue', 'hair_color': 'blond', 'planet_id': 1,
+}
+
+def test_second_request_is_served_from_the_cache(catalog, client, statements):
+    first = client.get('/characters?limit=5')
+    del statements[:]
+    second = client.get('/characters?limit=5')
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert statements == []
+
+def test_if_none_match_is_304_without_a_query(catalog, client, statements):
+    etag = client.get('/characters/1').headers['ETag']
+    assert etag == '"v1"'
+    del statements[:]
+    response = client.get('/characters/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert statements == []
+
+def test_a_write_invalidates_the_cached_responses(catalog, client):
+    etag = client.get('/characters/1').headers['ETag']
+    assert client.get('/characters?limit=5').json[0]['name'] == 'Character 1'
+    assert client.put('/characters/1', json=CHARACTER).status_code == 200
+
+    response = client.get('/characters/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['name'] == 'Luke'
+    assert response.headers['ETag'] == '"v2"'
+    assert client.get('/characters?limit=5').json[0]['name'] == 'Luke'
+
+def test_bulk_write_invalidates_the_cached_responses(admin, client):
+    assert client.get('/characters/2').json['height'] == 152
+    row = {'id': 2, 'name': 'Character 2', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown', 'height': 200}
+    assert client.post('/characters/bulk', json=[row], headers=auth_headers(admin)).status_code == 200
+    assert client.get('/characters/2').json['height'] == 200
+
+def test_query_strings_are_cached_apart(catalog, client):
+    assert len(client.get('/characters?limit=2').json) == 2
+    assert len(client.get('/characters?limit=3').json) == 3
+    assert client.get('/characters?limit=2&fields=name').json == [{'name': 'Character 1'}, {'name': 'Character 2'}]
+
+def test_errors_are_not_cached(catalog, client):
+    assert client.get('/characters/99').status_code == 404
+    db.session.add(Character(id=99, name='Late', gender='male', eye_color='blue', hair_color='brown'))
+    db.session.commit()
+    assert client.get('/characters/99').status_code == 200
@@ -0,0 +1,39 @@
+import gzip
+from conftest import add_favorites, auth_headers
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+def test_cached_response_is_gzipped_with_its_own_etag(catalog, client):
+    plain = client.get('/characters')
+    compressed = client.get('/characters', headers=GZIP)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    etag = plain.headers['ETag'].strip('"')
+    assert compressed.headers['ETag'] == '"%s-gzip"' % etag
+
+    # every encoding is revalidated against its own ETag
+    assert client.get('/characters', headers=dict(GZIP, **{'If-None-Match': compressed.headers['ETag']})).status_code == 304
+    assert client.get('/characters', headers=dict(GZIP, **{'If-None-Match': plain.headers['ETag']})).status_code == 200
+
+def test_cache_entry_is_compressed_once(catalog, client, monkeypatch):
+    client.get('/characters', headers=GZIP)
+    calls = []
+    monkeypatch.setattr('compression.compress', lambda body, encoding: calls.append(encoding) or b'')
+    for _ in range(3):
+        assert client.get('/characters', headers=GZIP).status_code == 200
+    assert calls == []
+
+def test_small_responses_are_not_compressed(catalog, client):
+    response = client.get('/characters/1', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"v1"'
+
+def test_responses_outside_the_cache_are_compressed(catalog, client):
+    add_favorites(20)
+    headers = auth_headers(1)
+    plain = client.get('/users/1/favorites', headers=headers)
+    compressed = client.get('/users/1/favorites', headers=dict(GZIP, **headers))
+    assert len(plain.data) >= 1024
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
@@ -0,0 +1,76 @@
+import pytest
+from conftest import add_favorites, auth_headers
+from favorites_queue import favorites_queue
+from models import db, Character, Vehicle, Favorites, FavoritesDocument
+
+@pytest.mark.parametrize('count', [1, 20])
+def test_with_targets_loads_favorites_in_one_query(catalog, statements, count):
+    add_favorites(count)
+    del statements[:]
+    favorites = [favorite.serialize_expanded() for favorite in Favorites.with_targets().filter_by(user_id=1)]
+    assert len(favorites) == count
+    assert len(statements) == 1
+
+@pytest.mark.parametrize('count', [1, 20])
+def test_user_favorites_query_count_does_not_grow(catalog, client, statements, count):
+    add_favorites(count)
+    headers = auth_headers(1)
+    del statements[:]
+    response = client.get('/users/1/favorites', headers=headers)
+    assert response.status_code == 200
+    assert len(response.json) == count
+    assert all(favorite['character'] or favorite['planet'] or favorite['vehicle'] for favorite in response.json)
+    assert len(statements) == 1
+
+def test_document_insert_ignores_a_concurrent_insert(catalog):
+    assert FavoritesDocument.insert(1, FavoritesDocument.build(1))
+    # the second request that found no row does not fail on the primary key
+    assert not FavoritesDocument.insert(1, FavoritesDocument.build(1))
+    db.session.commit()
+
+def test_add_target_adds_to_a_document_stored_concurrently(catalog, monkeypatch):
+    Favorites.add(1, 'character_id', 1)
+    FavoritesDocument.fetch(1)
+    # the document is not there yet when the add looks for it, and there when it inserts
+    locked = FavoritesDocument.locked
+    calls = []
+
+    def locked_later(cls, user_id):
+        calls.append(user_id)
+        return locked(user_id) if len(calls) > 1 else None
+
+    monkeypatch.setattr(FavoritesDocument, 'locked', classmethod(locked_later))
+    favorite_id = Favorites.add(1, 'planet_id', 2)
+    FavoritesDocument.add_target(1, 'planet_id', 2, favorite_id)
+    db.session.commit()
+    document = db.session.get(FavoritesDocument, 1).document
+    assert document['counts'] == {'characters': 1, 'planets': 1, 'vehicles': 0}
+
+def test_orm_rename_and_delete_drop_documents(catalog):
+    Favorites.add(1, 'character_id', 1)
+    Favorites.add(1, 'vehicle_id', 1)
+    FavoritesDocument.fetch(1)
+
+    # what Flask-Admin does: an ORM update of the row
+    db.session.get(Character, 1).name = 'Renamed'
+    db.session.commit()
+    assert db.session.get(FavoritesDocument, 1) is None
+    assert FavoritesDocument.fetch(1)['characters'][0]['name'] == 'Renamed'
+
+    db.session.delete(db.session.get(Vehicle, 1))
+    db.session.commit()
+    assert db.session.get(FavoritesDocument, 1) is None
+
+@pytest.mark.parametrize('write_behind', [False, True])
+@pytest.mark.parametrize('path', ['/favorite/characters/99', '/favorite/planet/99', '/favorite/vehicle/99'])
+def test_favorite_of_a_missing_target_is_404(catalog, client, monkeypatch, write_behind, path):
+    monkeypatch.setattr(favorites_queue, 'enabled', write_behind)
+    response = client.post(path, headers=auth_headers(1))
+    assert response.status_code == 404
+    assert Favorites.query.count() == 0
+    assert favorites_queue.overlay(1) == {}
+
+def test_favorite_of_an_existing_target_is_added(catalog, client):
+    response = client.post('/favorite/planet/2', headers=auth_headers(1))
+    assert response.status_code == 200
+    assert client.post('/favorite/planet/2', headers=auth_headers(1)).json['message'] == "Planet is already a favorite"
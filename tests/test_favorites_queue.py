@@ -0,0 +1,55 @@
+import time
+from favorites_queue import FavoritesQueue
+from models import db, Favorites
+
+def wait_flushed(queue, timeout=5):
+    deadline = time.monotonic() + timeout
+    while queue.metrics()['depth'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # the stats are updated right after the batch is taken off the queue
+    time.sleep(0.05)
+
+def favorite_ids(user_id, column):
+    db.session.expire_all()
+    return sorted(getattr(favorite, column) for favorite in Favorites.query.filter_by(user_id=user_id))
+
+def test_failed_operation_is_dropped_alone(catalog, monkeypatch):
+    queue = FavoritesQueue(enabled=True, flush_ms=1)
+    queue.app = catalog
+    write = FavoritesQueue.write
+
+    def failing_write(user_id, column, target_id, operation):
+        if target_id == 2:
+            raise RuntimeError("not a database error")
+        write(user_id, column, target_id, operation)
+
+    monkeypatch.setattr(FavoritesQueue, 'write', staticmethod(failing_write))
+    for character_id in (1, 2, 3):
+        queue.add(1, 'character_id', character_id)
+    wait_flushed(queue)
+    assert favorite_ids(1, 'character_id') == [1, 3]
+    assert queue.metrics()['failed'] == 1
+    queue.stop()
+
+def test_thread_survives_a_failing_flush(catalog, monkeypatch):
+    queue = FavoritesQueue(enabled=True, flush_ms=1)
+    queue.app = catalog
+    flush = FavoritesQueue.flush
+    calls = []
+
+    def flush_failing_once(self, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("unexpected")
+        flush(self, batch)
+
+    monkeypatch.setattr(FavoritesQueue, 'flush', flush_failing_once)
+    queue.add(1, 'planet_id', 1)
+    wait_flushed(queue)
+    assert queue.metrics()['failed'] == 1
+    # later operations are still written
+    queue.add(1, 'planet_id', 2)
+    wait_flushed(queue)
+    assert queue._thread.is_alive()
+    assert favorite_ids(1, 'planet_id') == [2]
+    queue.stop()
@@ -0,0 +1,36 @@
+import pytest
+
+def test_included_planet_is_embedded(catalog, client):
+    character = client.get('/characters/1?include=planet').json
+    assert character['planet']['name'] == 'Planet 2'
+    assert [vehicle['name'] for vehicle in client.get('/characters/1?include=vehicles').json['vehicles']] == ['Vehicle 1']
+
+@pytest.mark.parametrize('url', ['/characters?include=planet', '/characters/1?include=planet'])
+def test_planet_write_invalidates_the_characters_that_include_it(catalog, client, url):
+    def planet_names():
+        body = client.get(url).json
+        return {character['planet']['name'] for character in (body if isinstance(body, list) else [body])}
+
+    assert 'Planet 2' in planet_names()
+    assert client.patch('/planets/2', json={'name': 'Tatooine'}).status_code == 200
+    assert 'Tatooine' in planet_names()
+    assert 'Planet 2' not in planet_names()
+
+def test_characters_without_include_are_kept_on_a_planet_write(catalog, client, statements):
+    client.get('/characters/1')
+    assert client.patch('/planets/2', json={'name': 'Tatooine'}).status_code == 200
+    del statements[:]
+    assert client.get('/characters/1').status_code == 200
+    assert statements == []
+
+@pytest.mark.parametrize('include, queries', [('planet', 1), ('planet,vehicles', 2)])
+def test_one_query_per_include_whatever_the_page_size(catalog, client, statements, include, queries):
+    extra = []
+    for limit in (1, 10):
+        del statements[:]
+        client.get('/characters?limit=%d' % limit)
+        without = len(statements)
+        del statements[:]
+        client.get('/characters?limit=%d&include=%s' % (limit, include))
+        extra.append(len(statements) - without)
+    assert extra == [queries, queries]
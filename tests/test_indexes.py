@@ -0,0 +1,36 @@
+"""
+The indexes of migration ca7e5bf199ac (the same ones create_all() builds from the models)
+serve the filters, the sorts and the favorites lookup, checked with SQLite's EXPLAIN QUERY PLAN.
+"""
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+from serializers import ListQuery
+from models import db, Character, Planet, Favorites
+
+def query_plan(stmt):
+    sql = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+    return [row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN %s' % sql))]
+
+def list_plan(model, args, cursor_row=None):
+    return query_plan(ListQuery(model, MultiDict(args)).statement(cursor_row))
+
+def test_planet_id_filter_uses_index(catalog):
+    plan = list_plan(Character, {'planet_id': '2'})
+    assert any('USING INDEX ix_character_planet_id' in step for step in plan), plan
+
+@pytest.mark.parametrize('sort', ['population', '-population'])
+def test_population_sort_uses_index(catalog, sort):
+    plan = list_plan(Planet, {'sort': sort, 'limit': '10'})
+    assert any('USING INDEX ix_planet_population' in step for step in plan), plan
+    # the index gives the order, the table is not sorted as a whole
+    assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+
+@pytest.mark.parametrize('sort', ['population', '-population'])
+def test_population_sort_next_page_uses_index(catalog, sort):
+    plan = list_plan(Planet, {'sort': sort, 'limit': '10', 'after': '2'}, cursor_row=(2000,))
+    assert any('USING INDEX ix_planet_population' in step for step in plan), plan
+
+def test_favorites_of_a_user_use_index(catalog):
+    plan = query_plan(Favorites.with_targets().filter_by(user_id=1).statement)
+    assert any('USING INDEX ix_favorites_user_id' in step for step in plan), plan
@@ -0,0 +1,25 @@
+import threading
+from sqlalchemy import create_engine, text
+from pool import TimedQueuePool, pool_stats
+
+def test_only_checkouts_that_waited_count_as_waits(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'pool.db'), poolclass=TimedQueuePool, pool_size=1, max_overflow=0)
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    stats = pool_stats(engine)
+    assert stats['checkouts'] == 3
+    assert stats['waits'] == 0
+
+    # the only connection is held for a while, the next checkout waits for it
+    held = engine.connect()
+    release = threading.Timer(0.05, held.close)
+    release.start()
+    with engine.connect():
+        pass
+    release.join()
+    stats = pool_stats(engine)
+    assert stats['checkouts'] == 5
+    assert stats['waits'] == 1
+    assert stats['wait_time_max_ms'] >= 40
+    engine.dispose()
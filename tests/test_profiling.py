@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+import profiling
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'profiling.db'))
+    event.listen(engine, 'before_cursor_execute', profiling.before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', profiling.after_cursor_execute)
+    event.listen(engine, 'handle_error', profiling.handle_error)
+    yield engine
+    engine.dispose()
+
+def test_failed_statement_leaves_no_start_time(engine):
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM missing_table'))
+        connection.rollback()
+        connection.execute(text('SELECT 1'))
+        assert connection.info['query_start'] == {}
+
+def test_statements_are_timed_in_the_request_profile(app):
+    with app.test_request_context('/'):
+        profiling.g.profile = {'db_time': 0.0, 'statements': 0, 'slowest': []}
+        with create_engine('sqlite://').connect() as connection:
+            event.listen(connection.engine, 'before_cursor_execute', profiling.before_cursor_execute)
+            event.listen(connection.engine, 'after_cursor_execute', profiling.after_cursor_execute)
+            connection.execute(text('SELECT 1'))
+        assert profiling.g.profile['statements'] == 1
+        assert [statement for _, statement in profiling.g.profile['slowest']] == ['SELECT 1']
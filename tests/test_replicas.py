@@ -0,0 +1,83 @@
+import shutil
+import pytest
+from conftest import auth_headers, seed_catalog
+from cache import response_cache, cache_key
+from replicas import STICKY_COOKIE, replica_router
+from models import db, Favorites
+
+CHARACTER = {
+    'id': 1, 'name': 'Luke', 'birth_year': '19BBY', 'gender': 'male', 'height': 172, 'weight': 77,
+    'eye_color': 'blue', 'hair_color': 'blond', 'planet_id': 1,
+}
+
+@pytest.fixture
+def replicated(tmp_path, monkeypatch):
+    # the primary and a copy of it as the replica, which never sees the writes made after the copy
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///%s' % primary)
+    monkeypatch.setattr(replica_router, 'urls', ['sqlite:///%s' % replica])
+    monkeypatch.setattr(replica_router, 'names', ['replica_0'])
+    monkeypatch.setattr(replica_router, '_sticky', type(replica_router._sticky)())
+    from app import create_app
+    response_cache.clear()
+    app = create_app(migrations=False)
+    with app.app_context():
+        db.create_all(bind_key=None)
+        seed_catalog()
+    shutil.copy(primary, replica)
+    # no app context around the requests, g (and the replica picked) is per request
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    # registered on db by init_app, the apps of the next tests have no replica
+    db.metadatas.pop('replica_0', None)
+
+def client(app, name):
+    # clients told apart by their Authorization header, like two users behind one address
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer %s' % name
+    return client
+
+def test_writer_reads_its_write_through_the_cache(replicated):
+    writer, reader = client(replicated, 'writer'), client(replicated, 'reader')
+    assert reader.get('/characters/1').json['name'] == 'Character 1'
+    assert writer.put('/characters/1', json=CHARACTER).status_code == 200
+
+    # the replica has not caught up, this stale body must not be cached under the new version
+    assert reader.get('/characters/1').json['name'] == 'Character 1'
+    assert writer.get('/characters/1').json['name'] == 'Luke'
+    assert response_cache.get(cache_key('character', '/characters/1?')) is None
+
+def test_favorites_summary_is_built_from_the_primary(replicated):
+    with replicated.app_context():
+        # added after the copy, the replica has no favorite of user 1
+        Favorites.add(1, 'character_id', 1)
+        db.session.commit()
+        headers = auth_headers(1)
+    reader = replicated.test_client()
+    for _ in range(2):
+        response = reader.get('/users/1/favorites/summary', headers=headers)
+        assert response.status_code == 200
+        assert response.json['counts']['characters'] == 1
+
+def test_anonymous_clients_behind_one_address_are_not_pinned_together(replicated):
+    # test clients share the remote address 127.0.0.1, like the clients of a proxy
+    writer, reader = replicated.test_client(), replicated.test_client()
+    assert writer.put('/characters/1', json=CHARACTER).status_code == 200
+    assert reader.get('/characters/1').json['name'] == 'Character 1'
+    # the writer has its cookie
+    assert writer.get('/characters/1').json['name'] == 'Luke'
+
+def test_cors_preflight_is_not_a_write(replicated):
+    browser = client(replicated, 'browser')
+    response = browser.options('/characters/1', headers={
+        'Origin': 'https://example.com', 'Access-Control-Request-Method': 'PUT',
+    })
+    assert response.status_code == 200
+    assert STICKY_COOKIE not in response.headers.get('Set-Cookie', '')
+    before = replica_router.metrics()
+    assert browser.get('/characters/2').status_code == 200
+    after = replica_router.metrics()
+    assert after['sticky_reads'] == before['sticky_reads']
+    assert after['replica_reads'] == before['replica_reads'] + 1
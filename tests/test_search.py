@@ -0,0 +1,53 @@
+import pytest
+from conftest import auth_headers
+from models import db, Vehicle
+
+CHARACTER = {
+    'id': 20, 'name': 'Obi-Wan Kenobi', 'birth_year': '57BBY', 'gender': 'male', 'height': 182, 'weight': 77,
+    'eye_color': 'blue', 'hair_color': 'ginger', 'planet_id': 1,
+}
+
+def names(response):
+    assert response.status_code == 200
+    return [(result['type'], result['name']) for result in response.json]
+
+def test_index_follows_every_write(admin, client):
+    assert names(client.get('/search?q=kenobi')) == []
+    assert client.post('/characters', json=CHARACTER).status_code == 200
+    assert names(client.get('/search?q=kenobi')) == [('character', 'Obi-Wan Kenobi')]
+
+    assert client.put('/characters/20', json=dict(CHARACTER, name='Ben Kenobi')).status_code == 200
+    assert names(client.get('/search?q=obi')) == []
+    assert names(client.get('/search?q=ben+ken')) == [('character', 'Ben Kenobi')]
+
+    assert client.delete('/characters/20').status_code == 200
+    assert names(client.get('/search?q=kenobi')) == []
+
+    row = {'id': 21, 'name': 'Tatooine', 'climate': 'arid'}
+    assert client.post('/planets/bulk', json=[row], headers=auth_headers(admin)).status_code == 200
+    assert names(client.get('/search?q=tatoo')) == [('planet', 'Tatooine')]
+
+def test_name_matches_rank_first_among_many_matches(catalog, client):
+    # more matches than any pre-limit, the best one has the highest id
+    db.session.execute(Vehicle.__table__.insert(), [
+        {'id': i, 'name': 'Transport %d' % i, 'model': 'Xenon freighter'} for i in range(10, 1510)
+    ])
+    db.session.add(Vehicle(id=5000, name='Xenon', model='prototype'))
+    db.session.commit()
+    results = client.get('/search?q=xen&limit=3').json
+    assert [result['id'] for result in results][0] == 5000
+    assert len(results) == 3
+
+def test_type_filter(catalog, client):
+    # the catalog has "Planet <n>" planets and "Character <n>" characters
+    assert {kind for kind, _ in names(client.get('/search?q=planet+1'))} == {'planet'}
+    assert names(client.get('/search?q=planet+1&type=character,vehicle')) == []
+    assert client.get('/search?q=planet&type=starship').status_code == 400
+
+@pytest.mark.parametrize('query', ['q=planet&limit=abc', 'q=planet&limit=0', 'q=planet&limit=101', 'q=', 'q=%20-'])
+def test_invalid_queries_are_400(catalog, client, query):
+    assert client.get('/search?' + query).status_code == 400
+
+def test_limit(catalog, client):
+    assert len(client.get('/search?q=character&limit=2').json) == 2
+    assert len(client.get('/search?q=character').json) == 10
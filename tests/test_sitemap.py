@@ -0,0 +1,17 @@
+def test_sitemap_is_rendered_once(app, client, monkeypatch):
+    def iter_rules():
+        raise AssertionError("the url map is walked on a request")
+
+    monkeypatch.setattr(app.url_map, 'iter_rules', iter_rules)
+    html = client.get('/')
+    assert html.status_code == 200
+    assert html.mimetype == 'text/html'
+    assert b'/characters' in html.data
+    routes = client.get('/', headers={'Accept': 'application/json'})
+    assert routes.mimetype == 'application/json'
+    assert 'Accept' in routes.headers['Vary']
+
+def test_sitemap_is_revalidated_with_its_etag(app, client):
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/', headers={'If-None-Match': etag, 'Accept': 'application/json'}).status_code == 200
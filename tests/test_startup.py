@@ -0,0 +1,26 @@
+"""
+Cold start of an API-only worker (ENABLE_ADMIN=0): `import wsgi` in a fresh interpreter, timed
+with `python -X importtime` by benchmarks/startup.py.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from startup import import_times, measure
+
+API_ONLY = {'ENABLE_ADMIN': '0', 'ENABLE_SWAGGER': '0'}
+# median of the total import time, with room for slower CI machines
+STARTUP_BUDGET_MS = float(os.getenv('STARTUP_BUDGET_MS', 1000))
+# only the admin, `flask db`, the swagger spec and the Parquet export need them
+LAZY_MODULES = ('flask_admin', 'flask_migrate', 'alembic', 'flask_swagger', 'pyarrow')
+
+def test_api_only_worker_does_not_import_optional_modules():
+    modules = import_times(dict(os.environ, DATABASE_URL='sqlite://', **API_ONLY))
+    imported = sorted({name.split('.')[0] for name in modules} & set(LAZY_MODULES))
+    assert imported == []
+
+@pytest.mark.skipif(os.getenv('STARTUP_BUDGET_MS') == '0', reason="STARTUP_BUDGET_MS=0 disables the budget")
+def test_api_only_worker_starts_within_budget():
+    total, _ = measure(API_ONLY, runs=3)
+    assert total <= STARTUP_BUDGET_MS, "import wsgi takes %.1f ms, over the %.0f ms budget" % (total, STARTUP_BUDGET_MS)
@@ -0,0 +1,45 @@
+import sqlite3
+import pytest
+import transfer
+from conftest import auth_headers
+from models import db, Character
+
+def test_export_and_import_need_a_token(catalog):
+    client = catalog.test_client()
+    assert client.get('/export/favorites').status_code == 401
+    assert client.post('/import/favorites', json=[{'id': 1, 'user_id': 1, 'planet_id': 1}]).status_code == 401
+
+def test_export_and_import_need_an_admin(catalog):
+    client = catalog.test_client()
+    headers = auth_headers(1)
+    assert client.get('/export/favorites', headers=headers).status_code == 403
+    assert client.post('/import/favorites', json=[{'id': 1, 'user_id': 1, 'planet_id': 1}], headers=headers).status_code == 403
+
+def test_admin_can_export_and_import(catalog, admin):
+    client = catalog.test_client()
+    headers = auth_headers(admin)
+    response = client.post('/import/favorites', json=[{'id': 1, 'user_id': 1, 'planet_id': 1}], headers=headers)
+    assert response.status_code == 200
+    assert response.json['saved'] == 1
+    response = client.get('/export/favorites', headers=headers)
+    assert response.status_code == 200
+    assert b'"planet_id": 1' in response.data or b'"planet_id":1' in response.data
+
+def test_copy_error_of_the_driver_falls_back_to_row_by_row(catalog, monkeypatch):
+    # what psycopg2 raises from the raw cursor, a DBAPI error that is not a SQLAlchemyError
+    def copy_rows(model, columns, rows):
+        raise sqlite3.IntegrityError("duplicate key value violates unique constraint")
+
+    monkeypatch.setattr(transfer, 'can_copy', lambda: True)
+    monkeypatch.setattr(transfer, 'postgres_copy_rows', copy_rows)
+    rows = [
+        {'id': 11, 'name': 'Character 11', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown'},
+        {'id': 12, 'name': 'Character 1', 'gender': 'male', 'eye_color': 'blue', 'hair_color': 'brown'},
+        {'id': 13, 'name': 'Character 13', 'gender': 'robot', 'eye_color': 'blue', 'hair_color': 'brown'},
+        {'id': 14, 'name': 'Character 14', 'gender': 'female', 'eye_color': 'green', 'hair_color': 'black'},
+    ]
+    result = transfer.import_rows(Character, ((row, None) for row in rows))
+    assert result['saved'] == 2
+    assert [error['index'] for error in result['errors']] == [1, 2]
+    assert db.session.get(Character, 11) and db.session.get(Character, 14)
+    assert db.session.get(Character, 12) is None
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import event, update
+from models import db, Character
+
+CHARACTER = {
+    'id': 1, 'name': 'Luke', 'birth_year': '19BBY', 'gender': 'male', 'height': 172, 'weight': 77,
+    'eye_color': 'blue', 'hair_color': 'blond', 'planet_id': 1,
+}
+
+@pytest.fixture
+def concurrent_bump(catalog):
+    # another request writes the row between the read and the commit of this one
+    def bump(session, flush_context, instances):
+        session.execute(update(Character).where(Character.id == 1).values(version=Character.version + 1)
+                        .execution_options(synchronize_session=False))
+
+    event.listen(db.session, 'before_flush', bump)
+    yield
+    event.remove(db.session, 'before_flush', bump)
+
+def test_put_of_a_concurrently_modified_row_is_412(client, concurrent_bump):
+    response = client.put('/characters/1', json=CHARACTER)
+    assert response.status_code == 412
+    assert response.json == {"error": "Character was modified, reload it and try again"}
+
+def test_delete_of_a_concurrently_modified_row_is_412(client, concurrent_bump):
+    response = client.delete('/characters/1')
+    assert response.status_code == 412
+    assert db.session.get(Character, 1) is not None
+
+def test_patch_updates_the_given_fields_and_the_version(catalog, client):
+    etag = client.get('/characters/1').headers['ETag']
+    response = client.patch('/characters/1', json={'height': 200}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"v2"'
+    assert response.json['character']['height'] == 200
+    assert response.json['character']['name'] == 'Character 1'
+
+def test_patch_accepts_the_etag_of_a_compressed_copy(catalog, client):
+    response = client.patch('/characters/1', json={'height': 200}, headers={'If-Match': '"v1-gzip"'})
+    assert response.status_code == 200
+
+def test_patch_with_a_stale_if_match_is_412(catalog, client):
+    response = client.patch('/characters/1', json={'height': 200}, headers={'If-Match': '"v99"'})
+    assert response.status_code == 412
+    assert response.json == {"error": "Character was modified, reload it and try again"}
+    assert db.session.get(Character, 1).height == 151
+
+def test_patch_of_a_missing_row_is_404(catalog, client):
+    response = client.patch('/characters/99', json={'height': 200})
+    assert response.status_code == 404
+    assert response.json == {"error": "Character not found"}
+
+def test_patch_with_the_name_of_another_row_is_409(catalog, client):
+    response = client.patch('/characters/1', json={'name': 'Character 2'})
+    assert response.status_code == 409
+    assert 'error' in response.json
+    assert client.patch('/characters/1', json={'height': 200}).status_code == 200
+
+def test_delete_with_a_stale_if_match_is_412(catalog, client):
+    response = client.delete('/characters/1', headers={'If-Match': '"v99"'})
+    assert response.status_code == 412
+    assert response.json == {"error": "Character was modified, reload it and try again"}
+    assert db.session.get(Character, 1) is not None
+    assert client.delete('/characters/1', headers={'If-Match': '"v1"'}).status_code == 200